@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+"""
+    Linha de comando do pacote: python -m transparencia_scraper <comando> [--help]
+        * bases => lista as bases do catálogo e a quantidade de arquivos de cada uma
+        * plan => lista os arquivos novos (ou alterados, com --revalidate) sem baixá-los
+        * download => baixa os arquivos das bases e períodos selecionados
+        * diarias => consulta as diárias de um período
+    Os módulos dos scrapers (e, com eles, requests, BeautifulSoup, lxml e pandas) só são importados
+    pelo comando que precisa deles; com um snapshot válido do catálogo, 'bases' não importa nenhum deles.
+"""
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import argparse
+import json
+import logging
+import sys
+
+
+def get_log(args):
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()), format='%(asctime)s %(levelname)s %(message)s')
+    return logging.getLogger('transparencia_scraper')
+
+
+def get_metrics(args):
+    if not args.metrics:
+        return None
+    from .metrics import Metrics
+    return Metrics()
+
+
+def write_metrics(args, metrics):
+    if metrics:
+        metrics.write_prometheus(args.metrics)
+
+
+def get_transparencia(args, log, metrics=None):
+    from .transparencia_scraper import Transparencia_Scraper
+    return Transparencia_Scraper(log, catalog=args.catalog, manifest=getattr(args, 'manifest', None), metrics=metrics,
+                                 url_main=args.url_main, url_download=args.url_download)
+
+
+def in_period(params, period):
+    """
+        Args:
+            params (dict): parâmetros do arquivo ('a' => ano, 'm' => mês)
+            period (str): 'AAAA', 'AAAAMM' ou um intervalo 'AAAAMM:AAAAMM'
+        Returns:
+            True caso o arquivo pertença ao período; arquivos sem ano (Copa) pertencem a qualquer período
+    """
+    if not period or not params or 'a' not in params:
+        return True
+    start, _, end = period.partition(':')
+    end = end or start
+    key = params['a'] + (params.get('m') or '')
+    if len(key) == 4 or len(start) == 4:
+        return start[:4] <= key[:4] <= end[:4]
+    return start <= key[:6] <= end
+
+
+def select_files(planned, bases, period):
+    return [f for f in planned if (not bases or f['base'] in bases) and in_period(f['params'], period)]
+
+
+def cmd_bases(args):
+    files = None
+    if not args.refresh:
+        from .catalog import Schema_catalog
+        files = Schema_catalog(args.catalog).load()
+    if files is None:
+        files = get_transparencia(args, get_log(args)).get_catalog(refresh=True)
+    bases = {}
+    for base, params, _, _ in files:
+        if args.copa or base != 'Copa':
+            bases.setdefault(base, []).append(params.get('a') if params else None)
+    for base in sorted(bases):
+        years = [y for y in bases[base] if y]
+        print('{}\t{}\t{}'.format(base, len(bases[base]), '{}-{}'.format(min(years), max(years)) if years else ''))
+    return 0
+
+
+def cmd_plan(args):
+    scrap = get_transparencia(args, get_log(args))
+    planned = select_files(scrap.plan(args.copa, args.refresh, args.revalidate), args.base, args.period)
+    for f in planned:
+        if args.json:
+            print(json.dumps(f, ensure_ascii=False))
+        else:
+            print('{}\t{}\t{}'.format(f['status'], f['base'], f['filename']))
+    return 1 if args.exit_code and planned else 0
+
+
+def cmd_download(args):
+    log = get_log(args)
+    metrics = get_metrics(args)
+    scrap = get_transparencia(args, log, metrics)
+    if args.parquet:
+        from .parquet_ingest import Parquet_ingestor
+        scrap.ingestor = Parquet_ingestor(args.parquet, log=log)
+    files = None
+    if args.base or args.period:
+        # a partir do catálogo, e não de plan, para que arquivos já baixados sejam revalidados com o manifesto
+        files = [{'base': base, 'params': params, 'filename': filename, 'url': url}
+                 for base, params, filename, url in scrap.get_catalog(args.refresh) if args.copa or base != 'Copa']
+        files = select_files(files, args.base, args.period)
+    errors = scrap.process_schemas(args.copa, args.workers, args.per_host_limit, files)
+    if scrap.ingestor:
+        scrap.ingestor.close()
+    write_metrics(args, metrics)
+    return 1 if errors else 0
+
+
+def cmd_diarias(args):
+    from .diarias_scraper import Diarias_Scraper
+    log = get_log(args)
+    metrics = get_metrics(args)
+    writer = planner = details = None
+    if args.parquet:
+        from .diarias_store import Parquet_month_writer
+        writer = Parquet_month_writer(args.parquet, log=log)
+    if args.planner:
+        from .window_planner import Window_planner
+        planner = Window_planner()
+    if args.details:
+        from .diarias_details import Detail_fetcher
+        details = Detail_fetcher(args.details, fields=args.detail_fields, log=log)
+    scrap = Diarias_Scraper(log, sleep_time=args.sleep, checkpoint=args.checkpoint, parser=args.parser,
+                            writer=writer, metrics=metrics, planner=planner, details=details, url=args.url)
+    ok = scrap.process(args.date_in, args.date_out, workers=args.workers, retries=args.retries,
+                       parse_workers=args.parse_workers)
+    if details:
+        details.close()
+    write_metrics(args, metrics)
+    return 0 if ok else 1
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='python -m transparencia_scraper',
+                                     description='Coleta de dados do portal da transparência')
+    parser.add_argument('--log-level', default='warning', help='nível do log: debug, info, warning ou error')
+    commands = parser.add_subparsers(dest='command', metavar='comando')
+    commands.required = True
+
+    catalog = argparse.ArgumentParser(add_help=False)
+    catalog.add_argument('--catalog', default='catalog.json', help='snapshot do catálogo de bases')
+    catalog.add_argument('--refresh', action='store_true', help='refaz a descoberta das bases mesmo com snapshot válido')
+    catalog.add_argument('--copa', action='store_true', help='inclui os arquivos da Copa')
+    catalog.add_argument('--url-main', default='http://portaldatransparencia.gov.br/downloads/', help='página com a lista de bases')
+    catalog.add_argument('--url-download', default='http://arquivos.portaldatransparencia.gov.br/downloads.asp',
+                         help='endereço de download dos arquivos')
+    selection = argparse.ArgumentParser(add_help=False)
+    selection.add_argument('--manifest', default=None, help='manifesto SQLite dos arquivos baixados')
+    selection.add_argument('--base', action='append', help='base a considerar; pode ser repetido')
+    selection.add_argument('--period', default=None, help="período dos arquivos: 'AAAA', 'AAAAMM' ou 'AAAAMM:AAAAMM'")
+    metrics = argparse.ArgumentParser(add_help=False)
+    metrics.add_argument('--metrics', default=None, help='grava as métricas no formato do Prometheus neste arquivo')
+
+    command = commands.add_parser('bases', parents=[catalog], help='lista as bases e a quantidade de arquivos')
+    command.set_defaults(func=cmd_bases)
+
+    command = commands.add_parser('plan', parents=[catalog, selection], help='lista os arquivos a baixar')
+    command.add_argument('--revalidate', action='store_true', help='verifica se os arquivos já baixados foram alterados')
+    command.add_argument('--json', action='store_true', help='um objeto JSON por arquivo')
+    command.add_argument('--exit-code', action='store_true', help='termina com código 1 caso haja arquivos a baixar')
+    command.set_defaults(func=cmd_plan)
+
+    command = commands.add_parser('download', parents=[catalog, selection, metrics], help='baixa os arquivos')
+    command.add_argument('--workers', type=int, default=1, help='downloads simultâneos')
+    command.add_argument('--per-host-limit', type=int, default=None, help='downloads simultâneos por servidor')
+    command.add_argument('--parquet', default=None, help='converte os zips baixados em Parquet nesta pasta')
+    command.set_defaults(func=cmd_download)
+
+    command = commands.add_parser('diarias', parents=[metrics], help='consulta as diárias de um período')
+    command.add_argument('date_in', nargs='?', default=None, help='data inicial (AAAA-mm-dd); default o mês anterior')
+    command.add_argument('date_out', nargs='?', default=None, help='data final (AAAA-mm-dd)')
+    command.add_argument('--workers', type=int, default=1, help='consultas simultâneas')
+    command.add_argument('--parse-workers', type=int, default=0, help='processos de extração das páginas')
+    command.add_argument('--retries', type=int, default=3, help='novas tentativas de cada página')
+    command.add_argument('--sleep', type=float, default=30, help='intervalo, em segundos, entre as requisições')
+    command.add_argument('--parser', default='lxml', choices=['lxml', 'bs4'], help='extração das páginas')
+    command.add_argument('--checkpoint', default=None, help='checkpoint SQLite das páginas processadas')
+    command.add_argument('--planner', action='store_true', help='agrupa meses vazios em janelas maiores (requer --checkpoint)')
+    command.add_argument('--parquet', default=None, help='grava os resultados em Parquet nesta pasta em vez de CSV (requer --checkpoint)')
+    command.add_argument('--url', default='http://www.portaltransparencia.gov.br/despesasdiarias/',
+                         help='endereço base das consultas de diárias')
+    command.add_argument('--details', default=None, help='busca o detalhamento dos documentos, com cache neste arquivo SQLite')
+    command.add_argument('--detail-fields', action='append', default=None,
+                         help='rótulo do detalhamento a incluir nos resultados; pode ser repetido (obrigatório com --parquet)')
+    command.set_defaults(func=cmd_diarias)
+    return parser
+
+
+def main(argv=None):
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'diarias':
+        if args.parquet and not args.checkpoint:
+            parser.error('--parquet requer --checkpoint')
+        if args.planner and not args.checkpoint:
+            parser.error('--planner requer --checkpoint')
+        if args.details and args.parquet and not args.detail_fields:
+            parser.error('--details com --parquet requer --detail-fields, pois o schema do dataset é fixo')
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
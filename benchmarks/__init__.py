@@ -0,0 +1,6 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+"""
+    Compara a vazão (MB/s) de File_utils.download_file_from_url em cada modo de durabilidade,
+    baixando um arquivo servido por um servidor HTTP local.
+    Uso: python -m transparencia_scraper.benchmarks.bench_durability [tamanho em MB] [pasta de destino]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from ..http_utils import Http_session
+from ..transparencia_scraper import File_utils
+from .local_server import Local_server
+
+MODES = [('legado (32KB, fsync por bloco)', 32*1024, 32.0/1024),
+         ('none', 1024*1024, File_utils.DURABILITY_NONE),
+         ('close', 1024*1024, File_utils.DURABILITY_CLOSE),
+         ('a cada 64 MB', 1024*1024, 64)]
+
+
+class Quiet_progress:
+    def update(self, filename, complete, total):
+        pass
+
+    def finish(self, filename):
+        pass
+
+
+def main(size_mb=256, folder=None):
+    block = os.urandom(1024*1024)
+
+    def zip_file(handler):
+        return 200, {'Content-Length': str(size_mb * len(block))}, (block for _ in range(size_mb))
+
+    folder = tempfile.mkdtemp(dir=folder)
+    try:
+        with Local_server({'/': zip_file}) as server:
+            http = Http_session()
+            print('{:<32}{:>10}'.format('modo', 'MB/s'))
+            for name, chunk_size, durability in MODES:
+                files = File_utils(None, http, chunk_size=chunk_size, durability=durability, verify_zip=False)
+                files.progress = Quiet_progress()
+                filename = os.path.join(folder, 'arquivo.zip')
+                start = time.perf_counter()
+                files.download_file_from_url(server.url + '/downloads.asp', {}, filename)
+                elapsed = time.perf_counter() - start
+                os.remove(filename)
+                print('{:<32}{:>10.1f}'.format(name, size_mb / elapsed))
+            http.close()
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(*([int(args[0])] + args[1:] if args else []))
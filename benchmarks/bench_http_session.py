@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+"""
+    Compara a latência por requisição de requests.get (uma conexão por requisição)
+    com a de Http_session (pool de conexões keep-alive).
+    Uso: python -m transparencia_scraper.benchmarks.bench_http_session [quantidade de requisições]
+"""
+
+import statistics
+import sys
+import time
+import requests
+from ..http_utils import Http_session
+from .local_server import Local_server
+
+PAGE = b'<html><body>' + b'<p>transparencia</p>' * 500 + b'</body></html>'
+
+
+def page(handler):
+    return 200, {'Content-Type': 'text/html'}, PAGE
+
+
+def measure(get, url, n):
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        get(url).content
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main(n=500):
+    with Local_server({'/': page}) as server:
+        url = server.url + '/pagina'
+        http = Http_session()
+        results = [('requests.get', measure(requests.get, url, n)),
+                   ('Http_session', measure(http.get, url, n))]
+        http.close()
+
+    print('{:<15}{:>12}{:>12}{:>12}'.format('transporte', 'média (ms)', 'mediana', 'p95'))
+    for name, latencies in results:
+        latencies.sort()
+        print('{:<15}{:>12.3f}{:>12.3f}{:>12.3f}'.format(name,
+                                                         statistics.mean(latencies),
+                                                         statistics.median(latencies),
+                                                         latencies[int(len(latencies) * 0.95)]))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+"""
+    Compara a vazão (páginas/s) dos parsers de páginas de resultado de diárias
+    sobre as páginas salvas em benchmarks/fixtures, conferindo que o resultado é idêntico.
+    Uso: python -m transparencia_scraper.benchmarks.bench_parser [repetições] [páginas html...]
+"""
+
+import glob
+import os
+import sys
+import time
+from ..diarias_scraper import Diarias_Scraper
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'diarias_*.html')
+
+
+def main(repeat=50, *filenames):
+    pages = [open(f, 'rb').read() for f in (filenames or sorted(glob.glob(FIXTURES)))]
+    scrapers = [(parser, Diarias_Scraper(parser=parser)) for parser in ('bs4', 'lxml')]
+
+    expected = [scrapers[0][1].parse_page(content, '00000') for content in pages]
+    print('{:<8}{:>12}'.format('parser', 'páginas/s'))
+    for parser, scraper in scrapers:
+        assert [scraper.parse_page(content, '00000') for content in pages] == expected, \
+            'Resultado do parser {} difere do bs4'.format(parser)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for content in pages:
+                scraper.parse_page(content, '00000')
+        elapsed = time.perf_counter() - start
+        print('{:<8}{:>12.1f}'.format(parser, repeat * len(pages) / elapsed))
+
+
+if __name__ == '__main__':
+    main(*([int(sys.argv[1])] + sys.argv[2:] if len(sys.argv) > 1 else []))
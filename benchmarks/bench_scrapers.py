@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+"""
+    Mede a vazão de Transparencia_Scraper.process_schemas (arquivos/s, MB/s) e de Diarias_Scraper.process
+    (páginas/s) contra o servidor local Portal_stand_in, além do pico de memória (RSS) de cada cenário.
+    Cada cenário roda em um processo novo, para que o pico de memória de um não contamine o do outro.
+    Uso: python -m transparencia_scraper.benchmarks.bench_scrapers [--help]
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from .portal_server import Portal_stand_in
+
+
+def peak_rss():
+    """ Pico de memória residente do processo, em MB """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024.0 / (1024.0 if sys.platform == 'darwin' else 1)
+
+
+def quiet_log():
+    log = logging.getLogger('bench')
+    log.setLevel(logging.CRITICAL)
+    return log
+
+
+def run_schemas(url_main, url_download, workers):
+    from ..transparencia_scraper import Transparencia_Scraper
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        scrap = Transparencia_Scraper(quiet_log(), durability='none', url_main=url_main, url_download=url_download)
+        start = time.perf_counter()
+        errors = scrap.process_schemas(workers=workers)
+        elapsed = time.perf_counter() - start
+        files = [os.path.join(root, f) for root, _, names in os.walk(folder) for f in names if f.endswith('.zip')]
+        size = sum(os.path.getsize(f) for f in files)
+    return {'elapsed': elapsed, 'items': len(files), 'bytes': size, 'errors': len(errors), 'rss': peak_rss()}
+
+
+def run_diarias(url, months, workers, parse_workers):
+    from ..diarias_scraper import Diarias_Scraper
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        scrap = Diarias_Scraper(quiet_log(), sleep_time=0, captcha_pause=0.05, url=url)
+        start = time.perf_counter()
+        ok = scrap.process('2017-01-01', '2017-{:02d}-28'.format(months), workers=workers, parse_workers=parse_workers)
+        elapsed = time.perf_counter() - start
+        pages = [f for f in os.listdir(folder) if f.endswith('.csv')]
+        size = sum(os.path.getsize(os.path.join(folder, f)) for f in pages)
+    return {'elapsed': elapsed, 'items': len(pages), 'bytes': size, 'errors': 0 if ok else 1, 'rss': peak_rss()}
+
+
+def run_quiet(fn, *args):
+    """ Executa o cenário descartando a barra de progresso impressa na saída padrão """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return fn(*args)
+
+
+def run_isolated(fn, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(run_quiet, fn, *args).result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark dos scrapers contra o servidor local')
+    parser.add_argument('--bases', type=int, default=2, help='bases no índice de downloads')
+    parser.add_argument('--months', type=int, default=6, help='meses de cada base e de diárias')
+    parser.add_argument('--file-size', type=float, default=8, help='tamanho de cada zip, em MB')
+    parser.add_argument('--workers', type=int, default=4, help='threads do cenário concorrente')
+    parser.add_argument('--parse-workers', type=int, default=2, help='processos de extração do cenário com pool')
+    parser.add_argument('--latency', type=float, default=0.01, help='atraso, em segundos, de cada resposta')
+    parser.add_argument('--throttle', type=float, default=None, help='vazão máxima de cada download, em MB/s')
+    parser.add_argument('--no-content-length', action='store_true', help='envia os zips sem Content-Length')
+    parser.add_argument('--captcha', type=float, default=0.02, help='probabilidade de CAPTCHA nas páginas de diárias')
+    parser.add_argument('--orgs', type=int, default=3, help='órgãos superiores')
+    parser.add_argument('--pages', type=int, default=5, help='páginas de resultado por órgão/mês')
+    args = parser.parse_args(argv)
+
+    server = Portal_stand_in(bases=args.bases, months=args.months, file_size=int(args.file_size * 1024 * 1024),
+                             content_length=not args.no_content_length,
+                             throttle=args.throttle * 1024 * 1024 if args.throttle else None,
+                             latency=args.latency, captcha_rate=args.captcha, orgs=args.orgs, pages=args.pages)
+    scenarios = [('process_schemas workers=1', 'arquivos', run_schemas, (server.url_main, server.url_download, 1)),
+                 ('process_schemas workers={}'.format(args.workers), 'arquivos', run_schemas,
+                  (server.url_main, server.url_download, args.workers)),
+                 ('diarias workers=1', 'páginas', run_diarias, (server.url_diarias, args.months, 1, 0)),
+                 ('diarias workers={}'.format(args.workers), 'páginas', run_diarias,
+                  (server.url_diarias, args.months, args.workers, 0)),
+                 ('diarias workers={} parse_workers={}'.format(args.workers, args.parse_workers), 'páginas', run_diarias,
+                  (server.url_diarias, args.months, args.workers, args.parse_workers))]
+
+    print('{:<38}{:>10}{:>12}{:>10}{:>10}{:>10}{:>8}'.format('cenário', 'itens', 'unidade', 'itens/s', 'MB/s', 'RSS (MB)', 'erros'))
+    with server:
+        for name, unit, fn, fn_args in scenarios:
+            result = run_isolated(fn, *fn_args)
+            elapsed = result['elapsed'] or float('inf')
+            print('{:<38}{:>10}{:>12}{:>10.1f}{:>10.1f}{:>10.1f}{:>8}'.format(
+                name, result['items'], unit, result['items'] / elapsed,
+                result['bytes'] / 1024.0 / 1024.0 / elapsed, result['rss'], result['errors']))
+    print('requisições ao servidor: {}'.format(server.requests))
+
+
+if __name__ == '__main__':
+    main()
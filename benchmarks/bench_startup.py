@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+"""
+    Mede o tempo de inicialização da linha de comando (python -m transparencia_scraper) e da importação
+    dos módulos dos scrapers, cada execução em um interpretador novo, como nas tarefas do cron,
+    e indica quais dependências pesadas cada comando importa.
+    Uso: python -m transparencia_scraper.benchmarks.bench_startup [quantidade de execuções]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE = __package__.split('.')[0]
+HEAVY = ['requests', 'bs4', 'lxml', 'pandas', 'pyarrow', 'dateutil']
+
+
+def get_env():
+    """ Ambiente dos interpretadores, com a pasta que contém o pacote no PYTHONPATH """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    return env
+
+
+def make_catalog(folder):
+    """ Grava um snapshot válido do catálogo, para que os comandos não precisem acessar o portal """
+    from ..catalog import Schema_catalog
+    path = os.path.join(folder, 'catalog.json')
+    files = [('Base{}'.format(b), {'a': str(y), 'm': '{:02d}'.format(m), 'consulta': 'Base{}'.format(b)},
+              'Base{}/{}_{:02d}.zip'.format(b, y, m), 'http://127.0.0.1/downloads.asp')
+             for b in range(20) for y in range(2011, 2018) for m in range(1, 13)]
+    Schema_catalog(path).save(files)
+    return path
+
+
+def imported(args, env, cwd):
+    """ Dependências pesadas importadas pelo comando, segundo python -X importtime """
+    r = subprocess.run([sys.executable, '-X', 'importtime'] + args, env=env, cwd=cwd,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    modules = set(line.rsplit('|', 1)[-1].strip() for line in r.stderr.splitlines() if line.startswith('import time:'))
+    return [m for m in HEAVY if m in modules]
+
+
+def measure(args, env, cwd, n):
+    elapsed = []
+    for _ in range(n):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed.append((time.perf_counter() - start) * 1000)
+    return elapsed
+
+
+def main(n=10):
+    env = get_env()
+    with tempfile.TemporaryDirectory() as folder:
+        catalog = make_catalog(folder)
+        scenarios = [('python (referência)', ['-c', 'pass']),
+                     ('--help', ['-m', PACKAGE, '--help']),
+                     ('bases (catálogo válido)', ['-m', PACKAGE, 'bases', '--catalog', catalog]),
+                     ('plan (catálogo válido)', ['-m', PACKAGE, 'plan', '--catalog', catalog]),
+                     ('import transparencia_scraper', ['-c', 'import {}.transparencia_scraper'.format(PACKAGE)]),
+                     ('import diarias_scraper', ['-c', 'import {}.diarias_scraper'.format(PACKAGE)])]
+        print('{:<32}{:>12}{:>12}  {}'.format('comando', 'mediana ms', 'mínimo ms', 'dependências pesadas'))
+        for name, args in scenarios:
+            elapsed = measure(args, env, folder, n)
+            print('{:<32}{:>12.1f}{:>12.1f}  {}'.format(name, statistics.median(elapsed), min(elapsed),
+                                                       ', '.join(imported(args, env, folder)) or '-'))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
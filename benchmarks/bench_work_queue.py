@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+"""
+    Distribui as páginas de diárias do servidor local Portal_stand_in entre vários processos que consomem
+    a mesma Sqlite_work_queue (Diarias_Scraper.enqueue/process_queue) e mede a vazão (páginas/s).
+    Confere que cada página foi consultada uma única vez: as consultas recebidas pelo servidor devem ser
+    as páginas do período mais os CAPTCHAs, que são consultados novamente.
+    Uso: python -m transparencia_scraper.benchmarks.bench_work_queue [--help]
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import pandas as pd
+from multiprocessing import get_context
+from ..diarias_scraper import Diarias_Scraper
+from ..diarias_store import Parquet_month_writer
+from ..work_queue import Sqlite_work_queue
+from .portal_server import Portal_stand_in
+
+
+def quiet_log():
+    log = logging.getLogger('bench')
+    log.setLevel(logging.CRITICAL)
+    return log
+
+
+def get_scraper(url, folder, parquet):
+    writer = Parquet_month_writer(os.path.join(folder, 'diarias'), batch_size=100) if parquet else None
+    # um checkpoint por worker, como em máquinas diferentes; a fila é a única coordenação entre eles
+    checkpoint = os.path.join(folder, 'checkpoint-{}.sqlite'.format(os.getpid())) if parquet else None
+    return Diarias_Scraper(quiet_log(), sleep_time=0, captcha_pause=0.05, url=url, checkpoint=checkpoint,
+                           revision_months=0, writer=writer)
+
+
+def run_worker(url, folder, parquet, threads):
+    os.chdir(folder)
+    queue = Sqlite_work_queue(os.path.join(folder, 'work_queue.sqlite'))
+    ok = get_scraper(url, folder, parquet).process_queue(queue, workers=threads, lease_time=60)
+    queue.close()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Vazão e consultas repetidas de process_queue com vários processos')
+    parser.add_argument('--processes', type=int, default=3, help='processos consumindo a fila')
+    parser.add_argument('--threads', type=int, default=2, help='consultas simultâneas em cada processo')
+    parser.add_argument('--months', type=int, default=12, help='meses consultados (a partir de 2017-01)')
+    parser.add_argument('--latency', type=float, default=0.01, help='latência, em segundos, de cada resposta')
+    parser.add_argument('--captcha-rate', type=float, default=0.05, help='probabilidade de CAPTCHA')
+    parser.add_argument('--parquet', action='store_true', help='grava os resultados com Parquet_month_writer')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    with Portal_stand_in(months=args.months, latency=args.latency, captcha_rate=args.captcha_rate) as portal:
+        queue = Sqlite_work_queue(os.path.join(folder, 'work_queue.sqlite'))
+        # a data final é o primeiro dia do mês seguinte ao último mês consultado (ver load_time)
+        date_out = '{}-{:02d}-01'.format(2017 + args.months // 12, args.months % 12 + 1)
+        get_scraper(portal.url_diarias, folder, False).enqueue(queue, '2017-01-01', date_out)
+        before = dict(portal.requests)
+
+        context = get_context('spawn')
+        start = time.perf_counter()
+        workers = [context.Process(target=run_worker, args=(portal.url_diarias, folder, args.parquet, args.threads))
+                   for _ in range(args.processes)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+        pages = len(portal.orgs) * args.months * portal.pages
+        fetched = portal.requests['diarias'] - before['diarias']
+        captchas = portal.requests['captcha'] - before['captcha']
+        print('processos: {}  threads: {}  páginas: {}  segundos: {:.2f}  páginas/s: {:.1f}'.format(
+            args.processes, args.threads, pages, elapsed, pages / elapsed))
+        print('consultas: {}  CAPTCHAs: {}  consultas repetidas: {}  fila: {}'.format(
+            fetched, captchas, fetched - captchas - pages, queue.counts('diarias')))
+        if args.parquet:
+            rows = len(pd.read_parquet(os.path.join(folder, 'diarias')))
+            print('linhas gravadas: {}  esperadas: {}'.format(rows, pages * portal.rows))
+        queue.close()
+
+
+if __name__ == '__main__':
+    main()
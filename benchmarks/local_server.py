@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Local_server:
+    """
+        Servidor HTTP local, com suporte a keep-alive, usado nos benchmarks.
+        As rotas são registradas em um dicionário {prefixo do caminho: função(handler) -> (status, headers, corpo)}.
+    """
+    def __init__(self, routes, host='127.0.0.1', port=0):
+        """
+            Args:
+                routes (dict): {prefixo do caminho: função que recebe o handler e retorna (status, headers, corpo)}
+                host (str): endereço em que o servidor escuta
+                port (int): porta; 0 escolhe uma porta livre
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self)
+
+        self.routes = sorted(routes.items(), key=lambda r: -len(r[0]))
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def handle(self, handler):
+        for prefix, route in self.routes:
+            if handler.path.startswith(prefix):
+                status, headers, body = route(handler)
+                break
+        else:
+            status, headers, body = 404, {}, b''
+
+        handler.send_response(status)
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        if isinstance(body, bytes):
+            if 'Content-Length' not in headers:
+                handler.send_header('Content-Length', str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+        else: # gerador de blocos
+            handler.end_headers()
+            for chunk in body:
+                handler.wfile.write(chunk)
+            if 'Content-Length' not in headers:
+                handler.close_connection = True
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import datetime
+import hashlib
+import io
+import random
+import re
+import threading
+import time
+import zipfile
+from urllib.parse import parse_qs, urlparse
+from .local_server import Local_server
+
+ORGS = ['20000', '25000', '26000', '30000', '36000', '52000', '63000']
+
+
+class Portal_stand_in(Local_server):
+    """
+        Servidor local que imita o portal da transparência:
+            * /downloads/ => índice com as bases (mensal.asp?c=BaseN)
+            * /downloads/mensal.asp?c=BaseN => página da base com os parâmetros {"ano":...,"mes":...} dos arquivos
+            * /downloads.asp?a=...&m=...&consulta=... => arquivo zip, com ETag, com ou sem Content-Length e suporte
+              a Range/If-Range
+            * /despesasdiarias/resultado?... => páginas de resultado de diárias, paginadas
+            * /despesasdiarias/detalhe?documento=... => página de detalhamento de um documento
+        com latência, limite de vazão e CAPTCHAs configuráveis.
+    """
+    def __init__(self, bases=2, years=(2017,), months=12, file_size=1024*1024, content_length=True, ranges=True,
+                 throttle=None, latency=0, captcha_rate=0, orgs=3, pages=3, rows=50, daily_rows=None, missing_rate=0,
+                 seed=0, host='127.0.0.1', port=0):
+        """
+            Args:
+                bases (int): quantidade de bases no índice de downloads
+                years (list): anos disponíveis em cada base
+                months (int): meses disponíveis em cada ano
+                file_size (int): tamanho aproximado, em bytes, de cada arquivo zip
+                content_length (boolean): False para enviar os arquivos sem Content-Length (até o fim da conexão)
+                ranges (boolean): False para ignorar requisições Range nos arquivos
+                throttle (float): vazão máxima, em bytes por segundo, de cada download; None para não limitar
+                latency (float): atraso, em segundos, antes de cada resposta
+                captcha_rate (float): probabilidade de uma página de diárias ser um CAPTCHA (sem tabela)
+                orgs (int): quantidade de órgãos superiores (máximo len(ORGS))
+                pages (int): quantidade de páginas de resultado de cada órgão/mês
+                rows (int): quantidade de linhas de cada página de resultado
+                daily_rows (function): daily_rows(órgão, data) => quantidade de diárias do órgão no dia. Quando
+                    informada, as páginas refletem o período consultado (periodoInicio/periodoFim), com 'rows'
+                    linhas por página, em vez de 'pages' páginas fixas por consulta
+                missing_rate (float): fração dos documentos cujo detalhamento é a página de documento não encontrado;
+                    a escolha depende apenas do número do documento, de forma que se repete a cada consulta
+                seed (int): semente dos CAPTCHAs, para execuções reprodutíveis
+        """
+        self.bases = ['Base{}'.format(i + 1) for i in range(bases)]
+        self.years = years
+        self.months = months
+        self.content_length = content_length
+        self.ranges = ranges
+        self.throttle = throttle
+        self.latency = latency
+        self.captcha_rate = captcha_rate
+        self.orgs = ORGS[:orgs]
+        self.pages = pages
+        self.rows = rows
+        self.daily_rows = daily_rows
+        self.missing_rate = missing_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.zip = self.make_zip(file_size)
+        self.requests = {'index': 0, 'base': 0, 'file': 0, 'diarias': 0, 'detail': 0, 'captcha': 0}
+        Local_server.__init__(self, {'/downloads/mensal.asp': self.base_page,
+                                     '/downloads/': self.index_page,
+                                     '/downloads.asp': self.file,
+                                     '/despesasdiarias/resultado': self.diarias_page,
+                                     '/despesasdiarias/detalhe': self.detail_page}, host, port)
+
+    @property
+    def url_main(self):
+        return self.url + '/downloads/'
+
+    @property
+    def url_download(self):
+        return self.url + '/downloads.asp'
+
+    @property
+    def url_diarias(self):
+        return self.url + '/despesasdiarias/'
+
+    @staticmethod
+    def make_zip(size):
+        """ Monta um zip válido com um CSV de aproximadamente 'size' bytes, armazenado sem compressão """
+        line = '2017;01;000000000;NOME DO FAVORECIDO;1234,56\n'.encode('latin-1')
+        data = line * max(1, size // len(line))
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as z:
+            z.writestr('dados.csv', data)
+        return buffer.getvalue()
+
+    def __count(self, name):
+        with self.lock:
+            self.requests[name] += 1
+
+    def __wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def index_page(self, handler):
+        self.__wait()
+        self.__count('index')
+        links = ''.join('<li><a href="mensal.asp?c={}">{}</a></li>'.format(b, b) for b in self.bases)
+        body = '<html><body><div class="colunas"><ul>{}</ul></div></body></html>'.format(links)
+        return 200, {'Content-Type': 'text/html; charset=utf-8'}, body.encode('utf-8')
+
+    def base_page(self, handler):
+        self.__wait()
+        self.__count('base')
+        params = ','.join('{{"ano":"{}","mes":"{:02d}"}}'.format(y, m) for y in self.years for m in range(1, self.months + 1))
+        body = '<html><head><script>var arquivos = [{}];</script></head><body></body></html>'.format(params)
+        return 200, {'Content-Type': 'text/html; charset=utf-8'}, body.encode('utf-8')
+
+    def __stream(self, body):
+        block = 64 * 1024
+        for start in range(0, len(body), block):
+            chunk = body[start:start + block]
+            if self.throttle:
+                time.sleep(len(chunk) / self.throttle)
+            yield chunk
+
+    def file(self, handler):
+        self.__wait()
+        self.__count('file')
+        start = 0
+        status = 200
+        etag = '"{}"'.format(hashlib.md5(self.zip).hexdigest())
+        headers = {'Content-Type': 'application/zip', 'ETag': etag}
+        match = re.match(r'bytes=([0-9]+)-$', handler.headers.get('Range') or '')
+        if handler.headers.get('If-Range') not in (None, etag): # arquivo alterado: envia o arquivo completo
+            match = None
+        if self.ranges:
+            headers['Accept-Ranges'] = 'bytes'
+            if match:
+                start = int(match.group(1))
+                if start >= len(self.zip):
+                    return 416, {'Content-Range': 'bytes */{}'.format(len(self.zip))}, b''
+                status = 206
+                headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, len(self.zip) - 1, len(self.zip))
+        body = self.zip[start:]
+        if self.content_length:
+            headers['Content-Length'] = str(len(body))
+        if not self.throttle and self.content_length:
+            return status, headers, body
+        return status, headers, self.__stream(body)
+
+    def __captcha(self):
+        """ Returns: página de CAPTCHA, com probabilidade captcha_rate; None caso contrário """
+        with self.lock:
+            captcha = self.random.random() < self.captcha_rate
+        if not captcha:
+            return None
+        self.__count('captcha')
+        body = '<html><body><form id="captcha"><img src="captcha.jpg"/></form></body></html>'
+        return 200, {'Content-Type': 'text/html; charset=ISO-8859-1'}, body.encode('latin-1')
+
+    def diarias_page(self, handler):
+        self.__wait()
+        self.__count('diarias')
+        query = parse_qs(urlparse(handler.path).query)
+        org = query.get('codigoOS', ['63000'])[0]
+        page = int(query.get('pagina', ['1'])[0])
+        return self.__captcha() or (200, {'Content-Type': 'text/html; charset=ISO-8859-1'}, self.result_page(org, page, query))
+
+    def detail_page(self, handler):
+        self.__wait()
+        self.__count('detail')
+        document = parse_qs(urlparse(handler.path).query).get('documento', [''])[0]
+        captcha = self.__captcha()
+        if captcha:
+            return captcha
+        if int(hashlib.md5(document.encode()).hexdigest(), 16) % 1000 < self.missing_rate * 1000:
+            body = '<html><body><p>Documento n&atilde;o encontrado.</p></body></html>'
+            return 200, {'Content-Type': 'text/html; charset=ISO-8859-1'}, body.encode('latin-1')
+        fields = [('Documento', document), ('Favorecido', 'FAVORECIDO {}'.format(document[-4:])),
+                  ('Destino', 'Cidade {}'.format(int(document[-4:] or 0) % 27)),
+                  ('Motivo da viagem', 'Reuni&atilde;o t&eacute;cnica {}'.format(document))]
+        rows = ''.join('<tr><td class="rotulo">{}:</td><td>{}</td></tr>'.format(label, value) for label, value in fields)
+        body = '<html><body><h1>Detalhamento do documento</h1><table class="detalhe">{}</table></body></html>'.format(rows)
+        return 200, {'Content-Type': 'text/html; charset=ISO-8859-1'}, body.encode('latin-1')
+
+    def get_documents(self, org, page, query):
+        """
+            Returns:
+                (lista de (data, documento, sequencial) das linhas da página, quantidade de páginas da consulta)
+        """
+        date = query.get('periodoInicio', ['01/01/2017'])[0]
+        if not self.daily_rows:
+            return [(date, '{}{}{:03d}{:04d}'.format(org, date[3:5] + date[6:], page, i), i) for i in range(self.rows)], self.pages
+        day = datetime.datetime.strptime(date, '%d/%m/%Y').date()
+        last = datetime.datetime.strptime(query.get('periodoFim', [date])[0], '%d/%m/%Y').date()
+        documents = []
+        while day <= last:
+            documents.extend((day.strftime('%d/%m/%Y'), '{}{}{:04d}'.format(org, day.strftime('%Y%m%d'), i), i)
+                             for i in range(self.daily_rows(org, day)))
+            day += datetime.timedelta(days=1)
+        start = (page - 1) * self.rows
+        return documents[start:start + self.rows], max(1, (len(documents) + self.rows - 1) // self.rows)
+
+    def result_page(self, org, page, query):
+        """ Página de resultados no formato do portal, com a combo de órgãos, a tabela e a paginação """
+        options = ''.join('<option value="{}">Órgão {}</option>'.format(o, o) for o in self.orgs)
+        documents, pages = self.get_documents(org, page, query)
+        rows = []
+        for date, document, i in documents:
+            rows.append('<tr class="linha{}"><td class="firstChild"><a href="detalhe?documento={}">{}</a></td>'
+                        '<td>{}</td><td>Órgão {}</td><td>Unidade Gestora {}&nbsp;</td><td>\n  FAVORECIDO {}\n</td>'
+                        '<td class="colunaValor">{}.{:02d}</td></tr>'.format(i % 2 + 1, document, document, date, org, i,
+                                                                          i, 100 + i * 7, i))
+        table = ('<table class="tabela"><tr class="titulo_cabecalho"><th>Documento</th><th>Data</th>'
+                 '<th>&Oacute;rg&atilde;o Superior</th><th>Unidade&nbsp;Gestora</th><th>Favorecido</th><th>Valor (R$)</th></tr>'
+                 '{}</table>').format(''.join(rows)) if rows else '<p>Nenhum registro encontrado.</p>'
+        body = ('<html><body><form><select id="rapidaOS" name="codigoOS"><option value="TOD">Todos</option>{}</select></form>'
+                '{}<div class="paginacao"><span class="paginaXdeN">P&aacute;gina {} de {}</span></div>'
+                '</body></html>').format(options, table, page, pages)
+        return body.encode('latin-1')
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import json
+import os
+import time
+
+
+class Schema_catalog:
+    """
+        Snapshot local (JSON) do catálogo de bases e arquivos disponíveis no portal.
+        Enquanto o snapshot tiver menos de 'ttl' segundos, a descoberta das bases (página inicial
+        e página de cada base) não precisa ser refeita. A cada nova descoberta o snapshot anterior
+        é comparado com o novo, indicando os arquivos que surgiram e os que deixaram de existir.
+    """
+    def __init__(self, path='catalog.json', ttl=24*60*60):
+        """
+            Args:
+                path (str): caminho do arquivo JSON do snapshot
+                ttl (int): validade do snapshot, em segundos. Default 1 dia.
+        """
+        self.path = path
+        self.ttl = ttl
+
+    def read(self):
+        """
+            Returns:
+                dicionário {'created_at': timestamp, 'files': [...]} do snapshot gravado, ou None caso não exista
+        """
+        if not os.path.isfile(self.path):
+            return None
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def is_fresh(self, snapshot):
+        return snapshot is not None and time.time() - snapshot['created_at'] < self.ttl
+
+    def load(self):
+        """
+            Returns:
+                lista de tuplas (nome da base, parâmetros, nome do arquivo zip, url de download) do snapshot,
+                ou None caso ele não exista ou tenha expirado
+        """
+        snapshot = self.read()
+        if not self.is_fresh(snapshot):
+            return None
+        return [tuple(f) for f in snapshot['files']]
+
+    def save(self, files):
+        """
+            Grava um novo snapshot, substituindo o anterior.
+            Args:
+                files (list): lista de tuplas (nome da base, parâmetros, nome do arquivo zip, url de download)
+            Returns:
+                (arquivos novos, arquivos removidos) em relação ao snapshot anterior, como listas de nomes de arquivo.
+                Sem snapshot anterior, todos os arquivos são considerados novos.
+        """
+        previous = self.read()
+        previous = [tuple(f) for f in previous['files']] if previous else []
+
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.path + '.part', 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.time(), 'files': [list(f) for f in files]}, f, ensure_ascii=False)
+        os.replace(self.path + '.part', self.path)
+        return self.diff(previous, files)
+
+    @staticmethod
+    def diff(old, new):
+        """
+            Compara dois catálogos pelo nome dos arquivos.
+            Returns:
+                (nomes presentes apenas em new, nomes presentes apenas em old), ordenados
+        """
+        old = {f[2] for f in old}
+        new = {f[2] for f in new}
+        return sorted(new - old), sorted(old - new)
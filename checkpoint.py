@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class Diarias_checkpoint:
+    """
+        Checkpoint persistente (SQLite) das consultas de diárias.
+        Registra, para cada órgão e mês, a quantidade de páginas de resultado, as páginas já processadas
+        e se o mês foi concluído, permitindo que uma nova execução consulte apenas as páginas que faltam.
+    """
+    def __init__(self, path='diarias_checkpoint.sqlite'):
+        """
+            Args:
+                path (str): caminho do arquivo SQLite do checkpoint
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS months (
+                                     org TEXT,
+                                     month TEXT,
+                                     num_pages INTEGER,
+                                     completed INTEGER DEFAULT 0,
+                                     updated_at TEXT,
+                                     rows INTEGER,
+                                     PRIMARY KEY (org, month))''')
+            columns = [c[1] for c in self.conn.execute('PRAGMA table_info(months)')]
+            if 'rows' not in columns:
+                self.conn.execute('ALTER TABLE months ADD COLUMN rows INTEGER')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS pages (
+                                     org TEXT,
+                                     month TEXT,
+                                     page INTEGER,
+                                     done_at TEXT,
+                                     PRIMARY KEY (org, month, page))''')
+
+    def get_month(self, org, month):
+        """
+            Args:
+                org (str): código do órgão superior
+                month (str): mês no formato YYYYMM
+            Returns:
+                (quantidade de páginas, concluído) ou (None, False) caso o mês ainda não tenha sido consultado
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT num_pages, completed FROM months WHERE org = ? AND month = ?',
+                                    (org, month)).fetchone()
+        if not row:
+            return None, False
+        return row[0], bool(row[1])
+
+    def get_windows(self, org):
+        """
+            Args:
+                org (str): código do órgão superior
+            Returns:
+                lista de tuplas (mês ou janela, quantidade de páginas, linhas da página 1, concluído) já consultados
+                do órgão, usada por Window_planner
+        """
+        with self.lock:
+            rows = self.conn.execute('SELECT month, num_pages, rows, completed FROM months WHERE org = ? ORDER BY month',
+                                     (org,)).fetchall()
+        return [(month, num_pages, count, bool(completed)) for month, num_pages, count, completed in rows]
+
+    def start_month(self, org, month, num_pages, reset=False):
+        """
+            Registra a quantidade de páginas de um órgão/mês, lida na página 1.
+            Args:
+                org (str): código do órgão superior
+                month (str): mês no formato YYYYMM
+                num_pages (int): quantidade de páginas de resultado
+                reset (boolean): True para descartar as páginas já processadas (revisão do mês)
+        """
+        with self.lock, self.conn:
+            if reset:
+                self.conn.execute('DELETE FROM pages WHERE org = ? AND month = ?', (org, month))
+            self.conn.execute('INSERT OR REPLACE INTO months (org, month, num_pages, completed, updated_at) VALUES (?, ?, ?, 0, ?)',
+                              (org, month, num_pages, datetime.now().isoformat()))
+            self.__update_completed(org, month)
+
+    def set_rows(self, org, month, rows):
+        """ Registra a quantidade de linhas da página 1 do órgão/mês """
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE months SET rows = ? WHERE org = ? AND month = ?', (rows, org, month))
+
+    def page_done(self, org, month, page):
+        """ Registra que a página foi processada e, caso seja a última que faltava, conclui o mês """
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO pages (org, month, page, done_at) VALUES (?, ?, ?, ?)',
+                              (org, month, page, datetime.now().isoformat()))
+            self.__update_completed(org, month)
+
+    def __update_completed(self, org, month):
+        self.conn.execute('''UPDATE months SET completed = 1, updated_at = ?
+                             WHERE org = ? AND month = ? AND num_pages IS NOT NULL
+                               AND num_pages <= (SELECT COUNT(*) FROM pages WHERE org = ? AND month = ?)''',
+                          (datetime.now().isoformat(), org, month, org, month))
+
+    def is_page_done(self, org, month, page):
+        with self.lock:
+            row = self.conn.execute('SELECT 1 FROM pages WHERE org = ? AND month = ? AND page = ?',
+                                    (org, month, page)).fetchone()
+        return row is not None
+
+    def missing_pages(self, org, month):
+        """
+            Returns:
+                lista das páginas ainda não processadas do órgão/mês; vazia caso a quantidade de páginas seja desconhecida
+        """
+        num_pages, _ = self.get_month(org, month)
+        if not num_pages:
+            return []
+        with self.lock:
+            done = set(p for p, in self.conn.execute('SELECT page FROM pages WHERE org = ? AND month = ?', (org, month)))
+        return [p for p in range(1, num_pages+1) if p not in done]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
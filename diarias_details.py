@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import json
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from .diarias_parser import is_not_found_page, parse_detail_page
+
+
+class Captcha_error(IOError):
+    """ A página de detalhamento retornou um CAPTCHA em vez dos campos do documento """
+    pass
+
+
+class Detail_cache:
+    """
+        Cache local (SQLite) das páginas de detalhamento de documentos já extraídas,
+        para que novas execuções busquem apenas os documentos novos.
+    """
+    def __init__(self, path='diarias_detalhes.sqlite'):
+        """
+            Args:
+                path (str): caminho do arquivo SQLite do cache
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS details (
+                                     document TEXT PRIMARY KEY,
+                                     url TEXT,
+                                     fields TEXT,
+                                     fetched_at TEXT)''')
+
+    def get(self, document):
+        """
+            Args:
+                document (str): número do documento
+            Returns:
+                dicionário {rótulo: valor} do documento ou None caso ele não esteja no cache
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT fields FROM details WHERE document = ?', (document,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, document, url, fields):
+        """ Registra os campos extraídos da página de detalhamento do documento """
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO details (document, url, fields, fetched_at) VALUES (?, ?, ?, ?)',
+                              (document, url, json.dumps(fields, ensure_ascii=False), datetime.now().isoformat()))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class Detail_fetcher:
+    """
+        Enriquece os resultados de diárias com os campos das páginas de detalhamento de cada documento
+        (a coluna 'url' gravada por process_rows).
+        As páginas são buscadas em um pool de threads próprio, pelo fetch_response do scraper, e portanto
+        respeitam o mesmo controle de taxa das consultas. Cada documento é buscado uma única vez: documentos
+        repetidos, inclusive em páginas processadas ao mesmo tempo por threads diferentes, aguardam a mesma
+        requisição, e documentos já extraídos são lidos do cache. Documentos não encontrados no portal são
+        guardados sem campos; uma página sem campos e sem a mensagem de documento não encontrado é um CAPTCHA.
+    """
+    def __init__(self, cache=None, workers=4, fields=None, prefix='detalhe_', log=None):
+        """
+            Args:
+                cache (Detail_cache ou str): cache dos documentos já extraídos, ou o caminho do seu arquivo SQLite;
+                    se nulo, os documentos são guardados apenas em memória durante a execução
+                workers (int): quantidade de páginas de detalhamento buscadas simultaneamente
+                fields (list of strings): rótulos a incluir nos resultados, sempre nas mesmas colunas; se nulo,
+                    inclui todos os rótulos encontrados. Necessário com Parquet_month_writer, cujo schema é fixo.
+                prefix (str): prefixo dos nomes das colunas adicionadas
+                log (object): instância do log a registrar mensagens de error, debug e warning
+        """
+        if isinstance(cache, str):
+            cache = Detail_cache(cache)
+        self.cache = cache
+        self.fields = fields
+        self.prefix = prefix
+        self.log = log
+        self.lock = threading.Lock()
+        self.memory = {}
+        self.pending = {}
+        self.executor = ThreadPoolExecutor(workers)
+
+    def get(self, document, url, scraper):
+        """
+            Args:
+                document (str): número do documento
+                url (str): endereço da página de detalhamento
+                scraper (Diarias_Scraper): scraper cujo fetch_response é usado na requisição
+            Returns:
+                Future com o dicionário {rótulo: valor} do documento
+        """
+        with self.lock:
+            future = self.pending.get(document)
+            if future is not None:
+                return future
+            fields = self.cache.get(document) if self.cache else self.memory.get(document)
+            if fields is not None:
+                if scraper.metrics:
+                    scraper.metrics.increment('detail_pages_total', labels={'source': 'cache'})
+                future = Future()
+                future.set_result(fields)
+                return future
+            future = self.executor.submit(self.__fetch, document, url, scraper)
+            self.pending[document] = future
+            return future
+
+    def __fetch(self, document, url, scraper):
+        try:
+            r = scraper.fetch_response(url)
+            if r is None:
+                raise IOError('Erro ao consultar a url {}'.format(url))
+            fields = parse_detail_page(r.content)
+            if not fields and is_not_found_page(r.content):
+                # documento inexistente no portal: guardado sem campos, para não ser buscado novamente
+                if self.log:
+                    self.log.warning('Documento {} não encontrado no detalhamento'.format(document))
+            elif not fields:
+                scraper.captcha()
+                raise Captcha_error('CAPTCHA no detalhamento do documento {}'.format(document))
+            if scraper.metrics:
+                scraper.metrics.increment('detail_pages_total', labels={'source': 'fetch'})
+            # grava antes de sair de pending, para que um novo pedido do documento o encontre no cache
+            if self.cache:
+                self.cache.put(document, url, fields)
+            else:
+                with self.lock:
+                    self.memory[document] = fields
+            return fields
+        finally:
+            with self.lock:
+                self.pending.pop(document, None)
+
+    def enrich(self, header, results, scraper):
+        """
+            Adiciona às linhas os campos do detalhamento de cada documento.
+            Args:
+                header (list of strings): nomes das colunas da tabela
+                results (list of dict): linhas retornadas por process_rows
+                scraper (Diarias_Scraper): scraper cujo fetch_response é usado nas requisições
+            Returns:
+                (cabeçalho com as novas colunas, linhas enriquecidas)
+            Exception:
+                Captcha_error ou IOError caso algum documento não possa ser obtido; os já obtidos
+                ficam no cache e não são buscados novamente
+        """
+        futures = []
+        for row in results:
+            document = row.get('Documento')
+            url = row.get('url')
+            futures.append(self.get(document, url, scraper) if document and url else None)
+
+        error = None
+        details = []
+        for future in futures:
+            try:
+                details.append(future.result() if future else {})
+            except Exception as e:
+                error = error or e
+        if error:
+            raise error
+
+        labels = self.fields
+        if labels is None:
+            labels = []
+            for fields in details:
+                labels.extend(label for label in fields if label not in labels)
+        enriched = []
+        for row, fields in zip(results, details):
+            row = dict(row)
+            for label in labels:
+                row[self.prefix + label] = fields.get(label)
+            enriched.append(row)
+        return header + [self.prefix + label for label in labels if self.prefix + label not in header], enriched
+
+    def close(self):
+        self.executor.shutdown()
+        if self.cache:
+            self.cache.close()
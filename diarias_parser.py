@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import re
+import time
+import lxml.html
+from bs4 import BeautifulSoup
+from bs4.dammit import UnicodeDammit
+
+PAGES_PATTERN = re.compile(r'^Página ([0-9]+) de ([0-9]+)$')
+# mensagem da página de uma consulta sem resultados, exibida no lugar da tabela
+NO_RECORDS_PATTERN = re.compile(r'Nenhum (documento obedece aos crit.rios da consulta|registro encontrado)')
+# mensagem da página de detalhamento de um documento inexistente ou removido do portal
+NOT_FOUND_PATTERN = re.compile(r'(documento|registro|p.gina) n.o (foi )?encontrad[oa]', re.IGNORECASE)
+
+
+def is_no_records(text):
+    """
+        Args:
+            text (str): texto da página, já decodificado
+        Returns:
+            True caso a página seja a resposta do portal a uma consulta sem resultados
+    """
+    return NO_RECORDS_PATTERN.search(' '.join(text.split())) is not None
+
+
+def parse_timed(parser, content, org):
+    """
+        Executa parser.parse medindo o tempo gasto, inclusive quando executado em outro processo.
+        Returns:
+            (resultado de parser.parse, segundos)
+    """
+    start = time.perf_counter()
+    result = parser.parse(content, org)
+    return result, time.perf_counter() - start
+
+
+def parse_detail_page(content):
+    """
+        Extrai os campos da página de detalhamento de um documento: cada linha de tabela com duas células
+        (rótulo e valor) e cada par <dt>/<dd>. Rótulos repetidos mantêm o primeiro valor.
+        Args:
+            content (bytes ou str): conteúdo retornado pela página
+        Returns:
+            dicionário {rótulo: valor}, na ordem da página; vazio caso não haja campos
+            (documento não encontrado, ver is_not_found_page, ou CAPTCHA)
+    """
+    tree = Lxml_page_parser.to_tree(content)
+    pairs = []
+    for tr in tree.iter('tr'):
+        cells = [c for c in tr if c.tag in ('td', 'th')]
+        if len(cells) == 2:
+            pairs.append((cells[0].text_content(), cells[1].text_content()))
+    for dt in tree.iter('dt'):
+        dd = dt.getnext()
+        if dd is not None and dd.tag == 'dd':
+            pairs.append((dt.text_content(), dd.text_content()))
+
+    fields = {}
+    for label, value in pairs:
+        label = ' '.join(label.split()).rstrip(':').strip()
+        if label:
+            fields.setdefault(label, ' '.join(value.split()))
+    return fields
+
+
+def is_not_found_page(content):
+    """
+        Args:
+            content (bytes ou str): conteúdo retornado pela página de detalhamento
+        Returns:
+            True caso a página seja a mensagem do portal para um documento não encontrado
+    """
+    text = ' '.join(Lxml_page_parser.to_tree(content).text_content().split())
+    return NOT_FOUND_PATTERN.search(text) is not None
+
+
+class Soup_page_parser:
+    """
+        Extrai com BeautifulSoup a tabela de resultados, os links dos documentos e a paginação
+        de uma página de resultados de diárias.
+    """
+    def __init__(self, url):
+        """
+            Args:
+                url (str): endereço base usado para montar a url de detalhamento de cada documento
+        """
+        self.url = url
+
+    @staticmethod
+    def get_pages(soup):
+        """
+            Returns:
+                lista de tuplas (página atual, total de páginas), no mesmo formato de scrape_from_pattern
+        """
+        pages = []
+        for span in soup.find_all('span', class_='paginaXdeN'):
+            match = PAGES_PATTERN.match(span.text)
+            if match and span.get('class') == ['paginaXdeN'] and not span.find(True):
+                pages.append(match.groups())
+        return pages
+
+    @staticmethod
+    def get_page_content(soup, header=None):
+        """
+            Captura a tabela de resultados e seu cabeçalho
+            Args:
+                soup: conteúdo retornado por uma página web
+                header: Se for nulo, captura o header presente na tabela
+            Returns:
+                uma lista com os nomes das colunas da tabela
+                uma lista com as linhas da tabela, incluindo o cabeçalho; None caso a tabela não exista ou esteja vazia
+        """
+        contents = soup.find(class_='tabela')
+        if not contents:
+            return None, None
+
+        if not header:
+            header = [t.text.replace('\r', '').replace('\n', '').replace(' ', '').replace('&nbsp', '') for t in contents.find_all(class_='titulo_cabecalho')[0].find_all('th')]
+
+        result_rows = contents.find_all('tr')
+        if not result_rows:
+            return None, None
+        return header, result_rows
+
+    def process_rows(self, header, result_rows, org):
+        """ Ver Diarias_Scraper.process_rows """
+        results = []
+        for index, t in enumerate(result_rows):
+            if not index: # Pulo o header
+                continue
+
+            row = {}
+            for h in zip(header, t.find_all('td')):
+                text = h[1].text.replace('\n', '').replace('\r', '').strip()
+                if h[0].lower().find('valor') != -1:
+                    text = float(text.replace('(*)', '').strip())
+                row[h[0]] = text
+                if h[0] == 'Documento':
+                    row['url'] = self.url + h[1].a['href']
+                    row['cod_orgao_superior'] = org
+            results.append(row)
+        return results
+
+    def parse(self, content, org):
+        """
+            Extrai os dados de uma página de resultados.
+            Args:
+                content (bytes ou str): conteúdo retornado pela página
+                org (str): código do órgão superior consultado
+            Returns:
+                (cabeçalho, linhas em formato de dicionário, paginação);
+                cabeçalho e linhas são None caso a tabela não exista, e as linhas são uma lista vazia
+                caso a página seja a mensagem de consulta sem resultados
+        """
+        soup = BeautifulSoup(content, 'lxml')
+        pages = self.get_pages(soup)
+        header, result_rows = self.get_page_content(soup)
+        if not result_rows:
+            return None, [] if is_no_records(soup.get_text()) else None, pages
+        return header, self.process_rows(header, result_rows, org), pages
+
+
+class Lxml_page_parser:
+    """
+        Extrai diretamente com lxml/XPath a tabela de resultados, os links dos documentos e a paginação
+        de uma página de resultados de diárias, sem construir a árvore do BeautifulSoup.
+        O resultado é idêntico ao de Soup_page_parser.
+    """
+    XPATH_TABLE = "(//*[contains(concat(' ', normalize-space(@class), ' '), ' tabela ')])[1]"
+    XPATH_HEADER = "(.//*[contains(concat(' ', normalize-space(@class), ' '), ' titulo_cabecalho ')])[1]//th"
+    XPATH_PAGES = "//span[@class='paginaXdeN']"
+
+    def __init__(self, url):
+        """
+            Args:
+                url (str): endereço base usado para montar a url de detalhamento de cada documento
+        """
+        self.url = url
+
+    @staticmethod
+    def to_tree(content):
+        """
+            Converte o conteúdo da página em árvore lxml, decodificando-o com a mesma detecção
+            de codificação usada pelo BeautifulSoup.
+        """
+        if isinstance(content, bytes):
+            content = UnicodeDammit(content, is_html=True).unicode_markup
+        return lxml.html.fromstring(content)
+
+    def get_pages(self, tree):
+        """
+            Returns:
+                lista de tuplas (página atual, total de páginas), no mesmo formato de scrape_from_pattern
+        """
+        pages = []
+        for span in tree.xpath(self.XPATH_PAGES):
+            match = PAGES_PATTERN.match(span.text_content())
+            if match and not len(span):
+                pages.append(match.groups())
+        return pages
+
+    def get_page_content(self, tree):
+        """
+            Returns:
+                uma lista com os nomes das colunas da tabela
+                uma lista com as linhas da tabela, incluindo o cabeçalho; None caso a tabela não exista ou esteja vazia
+        """
+        contents = tree.xpath(self.XPATH_TABLE)
+        if not contents:
+            return None, None
+        contents = contents[0]
+        header = [t.text_content().replace('\r', '').replace('\n', '').replace(' ', '').replace('&nbsp', '')
+                  for t in contents.xpath(self.XPATH_HEADER)]
+        result_rows = contents.xpath('.//tr')
+        if not result_rows:
+            return None, None
+        return header, result_rows
+
+    def process_rows(self, header, result_rows, org):
+        """ Equivalente a Soup_page_parser.process_rows para linhas lxml """
+        valor = [h.lower().find('valor') != -1 for h in header]
+        results = []
+        for t in result_rows[1:]: # Pulo o header
+            row = {}
+            for name, is_valor, td in zip(header, valor, t.iter('td')):
+                text = td.text_content().replace('\n', '').replace('\r', '').strip()
+                if is_valor:
+                    text = float(text.replace('(*)', '').strip())
+                row[name] = text
+                if name == 'Documento':
+                    row['url'] = self.url + next(td.iter('a')).get('href')
+                    row['cod_orgao_superior'] = org
+            results.append(row)
+        return results
+
+    def parse(self, content, org):
+        """
+            Extrai os dados de uma página de resultados.
+            Args:
+                content (bytes ou str): conteúdo retornado pela página
+                org (str): código do órgão superior consultado
+            Returns:
+                (cabeçalho, linhas em formato de dicionário, paginação);
+                cabeçalho e linhas são None caso a tabela não exista, e as linhas são uma lista vazia
+                caso a página seja a mensagem de consulta sem resultados
+        """
+        tree = self.to_tree(content)
+        pages = self.get_pages(tree)
+        header, result_rows = self.get_page_content(tree)
+        if not result_rows:
+            return None, [] if is_no_records(tree.text_content()) else None, pages
+        return header, self.process_rows(header, result_rows, org), pages
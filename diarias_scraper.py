@@ -11,12 +11,23 @@ __version__ = "1.4"
 
 import os
 import pandas as pd
+import queue
 import re
 import requests
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-from .html_utils import Html_utils
+from .checkpoint import Diarias_checkpoint
+from .diarias_details import Captcha_error
+from .diarias_parser import Lxml_page_parser, Soup_page_parser, parse_timed
+from .html_utils import Html_response, Html_utils
+from .http_utils import Http_session
+from .rate_limiter import Fixed_rate_limiter
+from .scheduler import Work_scheduler
+from .window_planner import window_key
+from .work_queue import Queue_worker
 
 class Diarias_Scraper(Html_utils):
     """
@@ -25,16 +36,140 @@ class Diarias_Scraper(Html_utils):
         Gera uma tabela com os resultados disponibilizados pelo site de forma paginada.
         E salva o arquivo localmente.
     """
-    def __init__(self, log=None, sleep_time=30):
+    def __init__(self, log=None, sleep_time=30, http=None, rate_limiter=None, captcha_pause=300,
+                 checkpoint=None, revision_months=2, parser='lxml', writer=None, metrics=None,
+                 planner=None, details=None, url='http://www.portaltransparencia.gov.br/despesasdiarias/'):
         """
             Inicializa a classe com parâmetros importantes
             Args:
                log (object): instância do log a registrar mensagens de error, debug e warning
                sleep_time (int): tempo de sleep entre os requests feitos à página para não sobrecarregar o servidor
+               http (Http_session): sessão HTTP usada nas requisições; se nula, usa a sessão padrão compartilhada
+                   sem novas tentativas automáticas em respostas 429 (Http_session.default(rate_limited=True)).
+                   Uma sessão própria deve ser criada com rate_limited=True pelo mesmo motivo.
+               rate_limiter (object): controle de taxa das requisições, como Aimd_rate_limiter;
+                   se nulo, usa um intervalo fixo de sleep_time segundos entre as requisições
+               captcha_pause (int): tempo, em segundos, que todas as consultas ficam pausadas após um CAPTCHA
+               checkpoint (Diarias_checkpoint ou str): checkpoint das páginas processadas, ou o caminho do seu arquivo SQLite.
+                   Quando informado, substitui check_downloaded_file e uma nova execução consulta apenas as páginas que faltam.
+               revision_months (int): quantidade de meses mais recentes que são consultados novamente
+                   a cada execução, mesmo que já concluídos, pois ainda podem ser revisados pelo portal
+               parser (str): 'lxml' para extrair as tabelas diretamente com lxml/XPath (Lxml_page_parser)
+                   ou 'bs4' para usar BeautifulSoup com get_page_content e process_rows; o resultado é o mesmo
+               writer (Parquet_month_writer): grava os resultados em um dataset Parquet particionado por mês
+                   em vez de um CSV por página (save_results); requer checkpoint, que registra as páginas gravadas
+               metrics (Metrics): coleta latência das requisições, tempo dormindo no controle de taxa, tempo de
+                   extração e de gravação, novas tentativas e CAPTCHAs; None para desativar
+               planner (Window_planner): escolhe as janelas de consulta de cada órgão a partir das páginas e linhas
+                   registradas no checkpoint, agrupando meses vazios e dividindo meses muito grandes; requer checkpoint
+               details (Detail_fetcher): busca a página de detalhamento de cada documento, sem repetir documentos
+                   e usando o mesmo controle de taxa, e adiciona seus campos às linhas antes de gravá-las;
+                   com writer, os campos (fields) devem ser informados, pois o schema do dataset é fixo
+               url (str): endereço base das consultas de diárias
         """
+        if parser not in ('lxml', 'bs4'):
+            raise ValueError('Parser inválido: {}'.format(parser))
+        if planner and not checkpoint:
+            raise ValueError('O planejamento de janelas requer checkpoint')
+        if writer and not checkpoint:
+            raise ValueError('A gravação em Parquet requer checkpoint')
+        if writer and details and details.fields is None:
+            # o schema do dataset é fixado pela primeira página gravada; rótulos novos em páginas seguintes
+            # (ou páginas sem colunas detalhe_*) seriam rejeitados pelo writer a cada nova tentativa
+            raise ValueError('A gravação em Parquet requer os campos do detalhamento (Detail_fetcher fields)')
+        # o controle de taxa precisa receber as respostas 429, que a sessão padrão repetiria automaticamente
+        Html_utils.__init__(self, http or Http_session.default(rate_limited=True), metrics)
         self.log = log
-        self.url = 'http://www.portaltransparencia.gov.br/despesasdiarias/'
+        self.url = url
+        # Recording_session envolve a sessão real em .http
+        session = getattr(self.http, 'http', self.http)
+        if log and isinstance(session, Http_session) and not session.rate_limited:
+            log.warning('Sessão HTTP sem rate_limited=True: respostas 429 são repetidas automaticamente '
+                        'e não chegam ao controle de taxa')
         self.sleep_time = sleep_time
+        self.rate_limiter = rate_limiter or Fixed_rate_limiter(sleep_time)
+        self.captcha_pause = captcha_pause
+        if isinstance(checkpoint, str):
+            checkpoint = Diarias_checkpoint(checkpoint)
+        self.checkpoint = checkpoint
+        self.revision_months = revision_months
+        self.parser = parser
+        self.writer = writer
+        self.planner = planner
+        self.details = details
+        self.parse_pool = None
+        self.parse_queue = None
+        self.queue_worker = None
+
+    def fetch_response(self, url):
+        """
+            Busca a página respeitando o controle de taxa e informa a ele o resultado da requisição.
+            Args:
+                url (str): endereço completo da página a ser consultada
+            Returns:
+                objeto Html_response; None caso o servidor responda com 429 ou erro
+            Raises:
+                requests.RequestException: em caso de erro de conexão ou timeout, após informá-lo ao controle de taxa
+        """
+        wait = self.rate_limiter.acquire()
+        if self.metrics:
+            self.metrics.observe('sleep_seconds', wait or 0)
+        start = time.monotonic()
+        try:
+            r = self.get_response(url)
+        except requests.RequestException as e:
+            # conexões recusadas ou interrompidas e timeouts também indicam sobrecarga do servidor
+            self.rate_limiter.failure(type(e).__name__)
+            raise
+        elapsed = time.monotonic() - start
+        if r.status_code == 429 or r.status_code >= 500:
+            self.rate_limiter.failure('HTTP {}'.format(r.status_code))
+            if self.log:
+                self.log.error('Erro HTTP {} na url {}'.format(r.status_code, url))
+            return None
+        self.rate_limiter.success(elapsed)
+        if self.log:
+            self.log.debug('Taxa de requisições: {:.4f}/s'.format(self.rate_limiter.rate))
+        return Html_response(r)
+
+    def fetch_html(self, url):
+        """
+            Busca a página com fetch_response e a converte em estrutura html usando BeautifulSoup.
+            Returns:
+                None caso o servidor responda com 429 ou erro
+        """
+        r = self.fetch_response(url)
+        return r.soup if r is not None else None
+
+    def parse_page(self, content, org):
+        """
+            Extrai os dados de uma página de resultados com o parser configurado.
+            Args:
+                content (bytes): conteúdo retornado pela página
+                org (str): código do órgão superior consultado
+            Returns:
+                (cabeçalho, linhas em formato de dicionário, paginação no formato [(página, total)]);
+                cabeçalho e linhas são None caso a tabela não exista
+        """
+        if not self.metrics:
+            return self.get_page_parser().parse(content, org)
+        result, elapsed = parse_timed(self.get_page_parser(), content, org)
+        self.metrics.observe('parse_seconds', elapsed, {'parser': self.parser})
+        return result
+
+    def get_page_parser(self):
+        """ Retorna o parser configurado (Lxml_page_parser ou Soup_page_parser), que pode ser enviado a outros processos """
+        if self.parser == 'lxml':
+            return Lxml_page_parser(self.url)
+        return Soup_page_parser(self.url)
+
+    def captcha(self):
+        """ Registra a ocorrência de um CAPTCHA no controle de taxa """
+        if self.log:
+            self.log.error('CAPTCHA')
+        if self.metrics:
+            self.metrics.increment('captcha_total')
+        self.rate_limiter.failure('CAPTCHA')
         
     @staticmethod
     def load_time(date_in, date_out):
@@ -59,8 +194,8 @@ class Diarias_Scraper(Html_utils):
             date_in = format(last_month, '%Y-%m-01')  
             
         # Crio um range de datas a ser consultado
-        dates_in = pd.date_range(date_in, date_out, freq='1M')-pd.offsets.MonthBegin(1)
-        dates_out = pd.date_range(date_in, date_out, freq='1M') 
+        dates_in = pd.date_range(date_in, date_out, freq=pd.offsets.MonthEnd(1))-pd.offsets.MonthBegin(1)
+        dates_out = pd.date_range(date_in, date_out, freq=pd.offsets.MonthEnd(1)) 
         return dates_in, dates_out
     
     def get_org_sup(self, url):
@@ -71,14 +206,14 @@ class Diarias_Scraper(Html_utils):
             Returns:
                 a lista de órgãos disponíveis para consulta
         """
-        soup = self.get_html(url)
+        soup = self.fetch_html(url)
+        if soup is None:
+            return None
 
         orgs = []
         res = soup.find_all('select', {'id': 'rapidaOS'})
         if not res or not len(res):
-            if self.log:
-                self.log.error('CAPTCHA')
-            time.sleep(self.sleep_time)
+            self.captcha()
             return None
 
         for t in res[0].find_all('option'):
@@ -119,25 +254,13 @@ class Diarias_Scraper(Html_utils):
                 uma lista com as linhas retornadas na tabela
         """
         # TABELA DE RESULTADOS
-        contents = soup.find(class_='tabela')
-        if not contents:
-            if self.log:
-                self.log.debug('Tabela vazia')
-            return None, None
-
-        if not header:
-            header = [t.text.replace('\r', '').replace('\n', '').replace(' ', '').replace('&nbsp', '') for t in contents.find_all(class_='titulo_cabecalho')[0].find_all('th')]
-
-        results = []
-        result_rows = contents.find_all('tr')
+        header, result_rows = Soup_page_parser.get_page_content(soup, header)
         if not result_rows:
             if self.log:
-                self.log.debug('vazio')
+                self.log.debug('Tabela vazia')
             return None, None
-                
         return header, result_rows
 
-    
     def process_rows(self, header, result_rows, org):
         """
             Converte a tabela retornada pela página ao se fazer uma busca por órgão e data
@@ -152,23 +275,13 @@ class Diarias_Scraper(Html_utils):
             Returns:
                 lista com os dados em formato de dicionário
         """
-        results = []
-        for index, t in enumerate(result_rows):
-            if not index: # Pulo o header
-                continue
+        return Soup_page_parser(self.url).process_rows(header, result_rows, org)
+
+    @staticmethod
+    def is_empty_result(header, results):
+        """ Verifica se a tabela de resultados contém apenas a mensagem de consulta sem resultados """
+        return not results or str(results[0].get(header[0], '')).find('Nenhum documento obedece aos critérios da consulta') != -1
 
-            row = {}
-            for h in zip(header, t.find_all('td')):
-                text = h[1].text.replace('\n', '').replace('\r', '').strip()
-                if h[0].lower().find('valor') != -1:
-                    text = float(text.replace('(*)', '').strip())
-                row[h[0]] = text
-                if h[0] == 'Documento':
-                    row['url'] = self.url + h[1].a['href']
-                    row['cod_orgao_superior'] = org
-            results.append(row)
-        return results
-    
     def save_results(self, org, year, month, page, header, results):
         """
             Cria um dataframe com os resultados e salva localmente em CSV.
@@ -176,69 +289,378 @@ class Diarias_Scraper(Html_utils):
                 Nome do arquivo salvo; Caso o resultado da tabela seja vazio, retorna Nulo.
         """
         filename = '{}_{}{}_{}.csv'.format(org, year, str(month).zfill(2), page)
-        df = pd.DataFrame(results, columns=header.extend(['url']))
-
-        if df[header[0]].iloc[0].find('Nenhum documento obedece aos critérios da consulta') != -1:
+        if self.is_empty_result(header, results):
             if self.log:
                 self.log.debug('Nenhum documento obedece aos critérios da consulta')
             return None
+        df = pd.DataFrame(results, columns=header + ['url', 'cod_orgao_superior'])
         df.to_csv(filename, index=False)
         return filename
-        
-    def process(self, date_in=None, date_out=None):
-        header = None
 
+    def store_results(self, org, year, month, page, header, results):
+        """
+            Salva os resultados de uma página: com save_results ou, caso configurado, no writer.
+            As páginas são registradas no checkpoint apenas depois de gravadas em disco.
+        """
+        if not self.metrics:
+            return self.__store_results(org, year, month, page, header, results)
+        start = time.perf_counter()
+        self.__store_results(org, year, month, page, header, results)
+        self.metrics.observe('save_seconds', time.perf_counter() - start, {'writer': 'parquet' if self.writer else 'csv'})
+
+    def __store_results(self, org, year, month, page, header, results):
+        if self.writer is None or self.is_empty_result(header, results):
+            if self.writer is None:
+                self.save_results(org, year, month, page, header, results)
+            self.page_done(org, year, month, page)
+            return
+        for flushed in self.writer.write(org, year, month, page, header, results):
+            self.page_done(*flushed)
+
+    def get_query_url(self, org, date_in, date_out, page=1):
+        """
+            Monta a url de consulta de um órgão superior em um período.
+            Args:
+                org (str): código do órgão superior
+                date_in (datetime): data inicial do período
+                date_out (datetime): data final do período
+                page (int): página de resultados
+        """
+        url = self.url + 'resultado?consulta=rapida&periodoInicio={}&periodoFim={}&&fase=PAG&codigoOS={}&codigoFavorecido='.format(date_in.strftime('%d/%m/%Y'), date_out.strftime('%d/%m/%Y'), org)
+        if page != 1:
+            url += '&pagina={}'.format(page)
+        return url
+
+    def process_page(self, item, scheduler):
+        """
+            Processa um item de trabalho (órgão, data inicial, data final, página).
+            A página 1 de cada órgão/mês descobre, em handle_page, a quantidade de páginas e agenda as demais.
+            Em caso de CAPTCHA o processamento de todas as threads é pausado e o item é reagendado.
+            Args:
+                item (tuple): (órgão, data inicial, data final, página)
+                scheduler (Work_scheduler): escalonador usado para agendar as demais páginas
+        """
+        org, date_in, date_out, page = item
+        year, month = self.get_window(date_in, date_out)
+        revise = self.in_revision_window(date_in)
+        if page != 1 and self.is_page_done(org, year, month, page, revise):
+            return
+
+        url = self.get_query_url(org, date_in, date_out, page)
+        if self.log:
+            self.log.debug(url)
+        r = self.fetch_response(url)
+        if r is None:
+            raise IOError('Erro ao consultar a url {}'.format(url))
+        if self.parse_pool:
+            # a página será analisada em outro processo e tratada por consume_parsed
+            scheduler.begin()
+            try:
+                # bloqueia caso a fila esteja cheia, limitando as páginas em memória
+                self.parse_queue.put((item, self.parse_pool.submit(parse_timed, self.get_page_parser(), r.content, org)))
+            except Exception:
+                scheduler.end()
+                raise
+            return
+        header, results, pages = self.parse_page(r.content, org)
+        self.handle_page(item, header, results, pages, scheduler)
+
+    def handle_page(self, item, header, results, pages, scheduler):
+        """
+            Salva os resultados extraídos de uma página ou, caso a tabela não exista e a página não seja
+            a mensagem de consulta sem resultados nem a última página, trata a página como CAPTCHA: pausa todas
+            as threads e lança exceção para que o item seja reagendado.
+            Apenas uma página 1 válida registra a quantidade de páginas no checkpoint e descarta os dados de um mês
+            em revisão; as demais páginas são agendadas depois que ela é salva, para que uma nova tentativa
+            da página 1 não as agende novamente.
+            Args:
+                item (tuple): (órgão, data inicial, data final, página)
+                header (list of strings): nomes das colunas da tabela
+                results (list of dict): linhas da tabela; None caso a tabela não exista e vazia caso a página
+                    seja a mensagem de consulta sem resultados
+                pages (list): paginação no formato [(página, total)]
+                scheduler (Work_scheduler): escalonador do processamento
+        """
+        org, date_in, date_out, page = item
+        year, month = self.get_window(date_in, date_out)
+        revise = self.in_revision_window(date_in)
+        num_pages = int(pages[0][1]) if pages else 1
+        if results is None and not (pages and page == num_pages): # sem tabela e não é a última página
+            self.captcha()
+            scheduler.pause(self.captcha_pause)
+            raise IOError('CAPTCHA na página {} de {} {}{}'.format(page, org, year, month))
+        if results and self.is_empty_result(header, results):
+            # a mensagem de consulta sem resultados pode vir como uma linha da tabela; não é um documento
+            results = []
+
+        if page == 1:
+            # registrando a quantidade de páginas disponíveis
+            if self.checkpoint:
+                self.checkpoint.start_month(org, year + month, num_pages, reset=revise)
+                self.checkpoint.set_rows(org, year + month, len(results or []))
+            if self.writer and revise:
+                self.writer.reset(org, year, month)
+
+        if results is None: # última página sem tabela
+            self.page_done(org, year, month, page)
+        elif page != 1 or not self.is_page_done(org, year, month, page, revise):
+            if self.log:
+                self.log.debug('{} {}{} - PAGE = {} de {} - {} itens'.format(org, year, month, page, num_pages, len(results)))
+
+            if self.details and results:
+                try:
+                    header, results = self.details.enrich(header, results, self)
+                except Captcha_error:
+                    scheduler.pause(self.captcha_pause)
+                    raise
+
+            # salvando os resultados
+            self.store_results(org, year, month, page, header, results)
+
+        if page == 1:
+            # agendando as demais páginas
+            for next_page in range(2, num_pages+1):
+                if not self.is_page_done(org, year, month, next_page, revise):
+                    scheduler.put((org, date_in, date_out, next_page))
+
+    def consume_parsed(self, scheduler):
+        """
+            Consome, na ordem em que foram enviadas, as páginas analisadas pelo pool de processos
+            e salva seus resultados. Executado em uma thread própria enquanto as demais threads buscam páginas.
+        """
+        while True:
+            entry = self.parse_queue.get()
+            if entry is None:
+                return
+            item, future = entry
+            try:
+                (header, results, pages), elapsed = future.result()
+                if self.metrics:
+                    self.metrics.observe('parse_seconds', elapsed, {'parser': self.parser})
+                self.handle_page(item, header, results, pages, scheduler)
+            except Exception as e:
+                scheduler.retry(item, e)
+            finally:
+                scheduler.end()
+
+    def get_window(self, date_in, date_out):
+        """
+            Returns:
+                (ano, mês) usados nos nomes dos arquivos e no checkpoint. Com planner, janelas que não são um mês
+                completo usam como mês o restante da chave de window_key, ex.: ('2017', '0101-20170331')
+        """
+        if not self.planner:
+            return date_in.strftime('%Y'), date_in.strftime('%m')
+        key = window_key(date_in, date_out)
+        return key[:4], key[4:]
+
+    def get_windows(self, org, dates_in, dates_out):
+        """
+            Returns:
+                lista de tuplas (data inicial, data final) das janelas de consulta do órgão: os meses do período
+                ou, com planner, as janelas planejadas a partir do checkpoint. Meses em revisão são sempre mensais.
+        """
+        months = list(zip(dates_in, dates_out))
+        if not self.planner:
+            return months
+        fixed = set(d.strftime('%Y%m') for d, _ in months if self.in_revision_window(d))
+        windows = self.planner.plan(months, self.checkpoint.get_windows(org), fixed)
+        if self.log:
+            self.log.debug('{}: {} meses em {} janelas'.format(org, len(months), len(windows)))
+        return windows
+
+    def in_revision_window(self, date_in):
+        """
+            Indica se o mês ainda pode ser revisado pelo portal e, portanto, deve ser consultado novamente
+            mesmo que já tenha sido concluído.
+            Args:
+                date_in (datetime): primeiro dia do mês
+            Returns:
+                True caso o mês esteja entre os últimos revision_months meses
+        """
+        if not self.checkpoint:
+            return False
+        start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0) - relativedelta(months=self.revision_months)
+        return date_in >= start
+
+    def is_page_done(self, org, year, month, page, revise=False):
+        """
+            Verifica se a página já foi processada: pelo checkpoint, caso configurado, ou por check_downloaded_file.
+            Páginas de meses em revisão são sempre consultadas novamente.
+        """
+        if self.checkpoint:
+            return not revise and self.checkpoint.is_page_done(org, year + month, page)
+        return self.check_downloaded_file(org, year, month, page)
+
+    def page_done(self, org, year, month, page):
+        """
+            Registra no checkpoint, caso configurado, que a página foi processada e, em process_queue,
+            conclui na fila a página retida até a gravação do writer
+        """
+        if self.checkpoint:
+            self.checkpoint.page_done(org, year + month, page)
+        if self.queue_worker:
+            self.queue_worker.ack((org, year, month, page))
+
+    def flush_writer(self):
+        """ Grava as linhas acumuladas no writer e registra as páginas gravadas """
+        for flushed in self.writer.flush():
+            self.page_done(*flushed)
+
+    def get_pending_items(self, orgs, dates_in, dates_out):
+        """
+            Monta os itens de trabalho de cada órgão/mês (ou janela de get_windows, com planner).
+            Sem checkpoint, ou para meses ainda não consultados ou em revisão, agenda a página 1, que descobre as demais.
+            Para meses cuja quantidade de páginas já é conhecida, agenda diretamente as páginas que faltam
+            (apenas a página 1, caso ela esteja entre elas), e meses concluídos fora da janela de revisão são ignorados.
+            Returns:
+                lista de tuplas (órgão, data inicial, data final, página)
+        """
+        items = []
+        for org in orgs:
+            for date_in, date_out in self.get_windows(org, dates_in, dates_out):
+                if not self.checkpoint or self.in_revision_window(date_in):
+                    items.append((org, date_in, date_out, 1))
+                    continue
+                key = ''.join(self.get_window(date_in, date_out))
+                num_pages, completed = self.checkpoint.get_month(org, key)
+                if completed:
+                    continue
+                if not num_pages:
+                    items.append((org, date_in, date_out, 1))
+                    continue
+                missing = self.checkpoint.missing_pages(org, key)
+                if 1 in missing:
+                    # a página 1 agenda as demais ao ser salva (handle_page); agendá-las aqui duplicaria as requisições
+                    missing = [1]
+                items.extend((org, date_in, date_out, page) for page in missing)
+        # intercala os órgãos de cada período, como na consulta mês a mês
+        order = dict((org, i) for i, org in enumerate(orgs))
+        items.sort(key=lambda item: (item[1], order[item[0]]))
+        return items
+
+    def process(self, date_in=None, date_out=None, workers=1, retries=3, parse_workers=0, parse_queue_size=None):
+        """
+            Consulta todos os órgãos superiores em cada mês do período.
+            Cada (órgão, mês, página) é um item de trabalho independente, processado por um pool de threads
+            que compartilha o mesmo controle de taxa (rate_limiter).
+            Args:
+                date_in (str): data inicial de consulta no formato YYYY-mm-dd
+                date_out (str): data final de consulta no formato YYYY-mm-dd
+                workers (int): quantidade de consultas simultâneas
+                retries (int): quantidade de novas tentativas de cada página que falhar
+                parse_workers (int): quantidade de processos que analisam as páginas. Com 0 (padrão), cada página
+                    é analisada pela própria thread que a buscou; caso contrário, as threads apenas buscam as páginas
+                    e as enviam a um pool de processos, que as analisa enquanto novas requisições são feitas.
+                parse_queue_size (int): quantidade máxima de páginas aguardando análise; quando atingida, as threads
+                    de busca aguardam. Default 2 * parse_workers.
+            Returns:
+                True caso todas as páginas tenham sido processadas, False caso contrário
+        """
         dates_in, dates_out = self.load_time(date_in, date_out)
 
         orgs = self.get_org_sup(self.url + 'resultado?consulta=rapida&periodoInicio=14/11/2017&periodoFim=15/11/2017&&fase=PAG&codigoOS=63000&codigoFavorecido=')
         if not orgs:
             return False
-                    
-        # Realizo as consultas em si            
-        for d in zip(dates_in, dates_out):
-            if self.log:
-                self.log.warning("############## Processando data {} ##############".format(d[0].strftime('%Y%m')))
-            for index, org in enumerate(orgs):
-                if self.log:
-                    self.log.warning("%%%%%%%%%%% Processando orgao superior #{} - {} %%%%%%%%%%%".format(index, org))
-
-                # fazendo a consulta para obter os dados                
-                url = self.url + 'resultado?consulta=rapida&periodoInicio={}&periodoFim={}&&fase=PAG&codigoOS={}&codigoFavorecido='.format(d[0].strftime('%d/%m/%Y'), d[1].strftime('%d/%m/%Y'), org)
-                if self.log:
-                    self.log.debug(url)
-                soup = self.get_html(url)
-
-                # verificando a quantidade de páginas disponíveis
-                num_pages = self.scrape_from_pattern(str(soup), '\<span class=\"paginaXdeN\"\>Página 1 de ([0-9]+)\<\/span\>')
-                if num_pages:
-                    num_pages = int(num_pages[0])
-                else:
-                    num_pages = 1
-                    
-                # iterando entre as páginas para carregar todos os resultados
-                results = []
-                for page in range(1, num_pages+1):
-                    if self.check_downloaded_file(org, d[0].strftime('%Y'), d[0].strftime('%m'), page):
-                        continue
-                    url_page = url + '&pagina={}'.format(page)
-                    if page != 1:
-                        soup = self.get_html(url_page) 
-                        
-                    header, result_rows = self.get_page_content(soup, header)
-                    time.sleep(self.sleep_time)
-                    if not result_rows:
-                        if page == num_pages: # última página
-                            continue
-                        else:
-                            if self.log:
-                                self.log.error('CAPTCHA')
-                            return False
-                    results = self.process_rows(header, result_rows, org)
-                    if self.log:
-                        self.log.debug('PAGE = {} de {} - {} itens'.format(page, num_pages, len(results)))
-                    #results.extend(partial_results)
-
-                    # salvando os resultados
-                    self.save_results(org, d[0].strftime('%Y'), d[0].strftime('%m'), page, header, results)
-            return True
-                
+
+        if self.log:
+            self.log.warning("############## Processando {} órgãos de {} a {} ##############".format(
+                len(orgs), dates_in[0].strftime('%Y%m') if len(dates_in) else '', dates_in[-1].strftime('%Y%m') if len(dates_in) else ''))
+
+        items = self.get_pending_items(orgs, dates_in, dates_out)
+        if self.log:
+            self.log.warning('{} páginas a processar'.format(len(items)))
+        scheduler = Work_scheduler(self.process_page, workers, retries, self.log, self.metrics)
+        consumer = None
+        if parse_workers:
+            self.parse_pool = ProcessPoolExecutor(parse_workers)
+            self.parse_queue = queue.Queue(maxsize=parse_queue_size or 2 * parse_workers)
+            consumer = threading.Thread(target=self.consume_parsed, args=(scheduler,), daemon=True)
+            consumer.start()
+        try:
+            failures = scheduler.run(items)
+        finally:
+            if consumer:
+                self.parse_queue.put(None)
+                consumer.join()
+                self.parse_pool.shutdown()
+                self.parse_pool = None
+        if self.writer:
+            self.flush_writer()
+        if failures and self.log:
+            self.log.error('{} páginas não processadas'.format(len(failures)))
+        return not failures
+
+    @staticmethod
+    def encode_item(item):
+        """ Converte um item de trabalho no par (key, payload) usado na fila compartilhada """
+        org, date_in, date_out, page = item
+        date_in, date_out = date_in.strftime('%Y-%m-%d'), date_out.strftime('%Y-%m-%d')
+        return '{}:{}:{}:{}'.format(org, date_in, date_out, page), [org, date_in, date_out, page]
+
+    @staticmethod
+    def decode_item(payload):
+        """ Converte o payload da fila compartilhada no item de trabalho (órgão, data inicial, data final, página) """
+        org, date_in, date_out, page = payload
+        return org, pd.Timestamp(date_in), pd.Timestamp(date_out), int(page)
+
+    def __get_buffered_page(self, payload):
+        """ Identificação, no formato retornado por writer.flush, da página do item ainda não gravada pelo writer """
+        org, date_in, date_out, page = self.decode_item(payload)
+        year, month = self.get_window(date_in, date_out)
+        return self.writer.get_buffered(org, year, month, page)
+
+    def enqueue(self, work_queue, date_in=None, date_out=None):
+        """
+            Enfileira em uma fila de trabalho compartilhada as páginas iniciais de cada órgão/mês do período
+            (ou as páginas que faltam, segundo o checkpoint). As demais páginas são enfileiradas
+            por quem processar a página 1.
+            Args:
+                work_queue (Work_queue): fila compartilhada
+                date_in (str): data inicial de consulta no formato YYYY-mm-dd
+                date_out (str): data final de consulta no formato YYYY-mm-dd
+            Returns:
+                quantidade de páginas enfileiradas, ou None caso os órgãos não tenham sido encontrados
+        """
+        dates_in, dates_out = self.load_time(date_in, date_out)
+        orgs = self.get_org_sup(self.url + 'resultado?consulta=rapida&periodoInicio=14/11/2017&periodoFim=15/11/2017&&fase=PAG&codigoOS=63000&codigoFavorecido=')
+        if not orgs:
+            return None
+        items = self.get_pending_items(orgs, dates_in, dates_out)
+        # as páginas pendentes segundo o checkpoint, inclusive as dos meses em revisão, voltam à fila mesmo que já concluídas
+        added = work_queue.put_many('diarias', [self.encode_item(item) for item in items], requeue=True)
+        if self.log:
+            self.log.warning('{} páginas enfileiradas'.format(added))
+        return added
+
+    def process_queue(self, work_queue, worker=None, workers=1, lease_time=10*60, retries=3):
+        """
+            Processa as páginas enfileiradas por enqueue até que a fila se esgote; as páginas descobertas
+            na página 1 de cada órgão/mês são enfileiradas para qualquer worker.
+            Vários processos, em uma ou mais máquinas, podem consumir a mesma fila sem repetir páginas.
+            Com writer, as páginas só são concluídas na fila depois que o writer as grava em disco; até lá
+            permanecem concedidas a este worker, e são consultadas novamente caso ele seja interrompido.
+            Args:
+                work_queue (Work_queue): fila compartilhada
+                worker (str): identificador deste worker; default '<máquina>-<pid>'
+                workers (int): quantidade de consultas simultâneas neste worker
+                lease_time (float): prazo, em segundos, para processar cada página antes que ela seja entregue a outro worker
+                retries (int): quantidade de novas tentativas de cada página
+            Returns:
+                True caso todas as páginas da fila tenham sido processadas, False caso contrário
+        """
+        handler = lambda payload, scheduler: self.process_page(self.decode_item(payload), scheduler)
+        hold = flush = None
+        if self.writer:
+            hold = self.__get_buffered_page
+            flush = self.flush_writer
+        self.queue_worker = Queue_worker(work_queue, 'diarias', handler, worker, workers, lease_time, retries,
+                                         encode=self.encode_item, log=self.log, metrics=self.metrics,
+                                         requeue=True, hold=hold, flush=flush)
+        try:
+            failures = self.queue_worker.run()
+        finally:
+            self.queue_worker = None
+        if failures and self.log:
+            self.log.error('{} páginas não processadas'.format(len(failures)))
+        return not failures
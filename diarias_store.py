@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import argparse
+import glob
+import os
+import re
+import threading
+import time
+import uuid
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DATE_PATTERN = re.compile(r'^\s*[0-9]{2}/([0-9]{2})/([0-9]{4})')
+
+
+class Parquet_month_writer:
+    """
+        Grava os resultados de diárias em um dataset Parquet particionado por mês:
+        <root>/ano=AAAA/mes=MM/org-<órgão>-<id>.parquet.
+        As linhas são acumuladas em memória e gravadas em lote a cada batch_size linhas,
+        com schema fixo: colunas de valor como float64, 'pagina' como int32 e as demais como texto.
+        Resultados de janelas de Window_planner (mês no formato 'MMDD-YYYYMMDD') são distribuídos
+        entre as partições pela coluna 'Data' de cada linha.
+    """
+    def __init__(self, root='diarias', batch_size=5000, log=None, source=None):
+        """
+            Args:
+                root (str): pasta raiz do dataset
+                batch_size (int): quantidade de linhas acumuladas antes de uma gravação
+                log (object): instância do log a registrar mensagens de error, debug e warning
+                source (str): origem das linhas; se informada, cada órgão/mês (ou janela) é gravado em um arquivo
+                    de nome fixo org-<órgão>-<origem>-<AAAAMM ou janela>.parquet, substituído a cada nova gravação,
+                    em vez de um novo arquivo por lote. Usado por compact_csv, que grava cada órgão/mês de uma vez.
+        """
+        self.root = root
+        self.batch_size = batch_size
+        self.log = log
+        self.source = source
+        self.lock = threading.Lock()
+        self.schema = None
+        self.buffer = {}
+        self.pages = {}
+        self.buffered = 0
+
+    def get_folder(self, year, month):
+        return os.path.join(self.root, 'ano={}'.format(year), 'mes={}'.format(str(month).zfill(2)))
+
+    @staticmethod
+    def get_schema(header):
+        """
+            Monta o schema fixo a partir do cabeçalho da tabela de resultados.
+            Args:
+                header (list of strings): nomes das colunas da tabela web
+        """
+        fields = [pa.field(h, pa.float64() if h.lower().find('valor') != -1 else pa.string()) for h in header]
+        fields += [pa.field('url', pa.string()), pa.field('cod_orgao_superior', pa.string()), pa.field('pagina', pa.int32())]
+        return pa.schema(fields)
+
+    def write(self, org, year, month, page, header, results):
+        """
+            Acumula as linhas de uma página de resultados, gravando o lote caso batch_size seja atingido.
+            Args:
+                org (str): código do órgão superior
+                year (str): ano ao qual o dado se refere
+                month (str): mês ao qual o dado se refere
+                page (int): número da página de resultados
+                header (list of strings): nomes das colunas da tabela web
+                results (list of dict): linhas retornadas por process_rows
+            Returns:
+                lista de (órgão, ano, mês, página) das páginas efetivamente gravadas em disco nesta chamada
+        """
+        with self.lock:
+            if self.schema is None:
+                self.schema = self.get_schema(header)
+            key = (str(org), str(year), str(month).zfill(2))
+            rows = self.buffer.setdefault(key, [])
+            for row in results:
+                row = dict(row)
+                row['pagina'] = page
+                rows.append(row)
+            self.pages.setdefault(key, []).append(page)
+            self.buffered += len(results)
+            if self.buffered < self.batch_size:
+                return []
+            return self.__flush()
+
+    def get_buffered(self, org, year, month, page):
+        """
+            Returns:
+                (órgão, ano, mês, página), no formato retornado por flush, caso a página tenha sido recebida
+                por write e ainda não tenha sido gravada em disco; None caso contrário
+        """
+        with self.lock:
+            key = (str(org), str(year), str(month).zfill(2))
+            if page in self.pages.get(key, []):
+                return key + (page,)
+            return None
+
+    def flush(self):
+        """
+            Grava as linhas acumuladas.
+            Returns:
+                lista de (órgão, ano, mês, página) das páginas gravadas
+        """
+        with self.lock:
+            return self.__flush()
+
+    def __flush(self):
+        flushed = []
+        for (org, year, month), rows in self.buffer.items():
+            if rows:
+                self.write_table(org, year, month, rows)
+            flushed.extend((org, year, month, page) for page in self.pages.get((org, year, month), []))
+        self.buffer = {}
+        self.pages = {}
+        self.buffered = 0
+        return flushed
+
+    def write_table(self, org, year, month, rows):
+        """ Grava as linhas de um órgão/mês em um novo arquivo da partição do mês """
+        if len(month) == 2:
+            return self.__write_partition(org, year, month, rows)
+        # janela com mais de um mês ou parte de um mês: cada linha vai para a partição do mês da sua data
+        partitions = {}
+        for row in rows:
+            match = DATE_PATTERN.match(str(row.get('Data') or ''))
+            partition = (match.group(2), match.group(1)) if match else (year, month[:2])
+            partitions.setdefault(partition, []).append(row)
+        for (part_year, part_month), part_rows in sorted(partitions.items()):
+            self.__write_partition(org, part_year, part_month, part_rows, '{}{}-'.format(year, month))
+
+    def __write_partition(self, org, year, month, rows, window=''):
+        columns = {}
+        for field in self.schema:
+            values = [row.get(field.name) for row in rows]
+            if pa.types.is_string(field.type):
+                values = [None if v is None or v != v else str(v) for v in values]
+            columns[field.name] = pa.array(values, type=field.type)
+        extra = set().union(*rows) - set(self.schema.names)
+        if extra:
+            raise ValueError('Colunas fora do schema: {}'.format(', '.join(sorted(extra))))
+
+        folder = self.get_folder(year, month)
+        os.makedirs(folder, exist_ok=True)
+        if self.source:
+            name = 'org-{}-{}-{}.parquet'.format(org, self.source, window.rstrip('-') or year + month)
+        else:
+            name = 'org-{}-{}{}-{}.parquet'.format(org, window, time.strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+        filename = os.path.join(folder, name)
+        pq.write_table(pa.table(columns, schema=self.schema), filename + '.part')
+        os.replace(filename + '.part', filename)
+        if self.log:
+            self.log.debug('{} linhas gravadas em {}'.format(len(rows), filename))
+
+    def reset(self, org, year, month):
+        """ Descarta os dados já gravados e acumulados de um órgão/mês, antes de consultá-lo novamente """
+        with self.lock:
+            key = (str(org), str(year), str(month).zfill(2))
+            self.buffered -= len(self.buffer.pop(key, []))
+            self.pages.pop(key, None)
+            for filename in glob.glob(os.path.join(self.get_folder(year, month), 'org-{}-*.parquet'.format(org))):
+                os.remove(filename)
+
+    def close(self):
+        return self.flush()
+
+
+def compact_csv(folder='.', root='diarias', remove=False, log=None):
+    """
+        Converte os CSVs gerados por Diarias_Scraper.save_results (<órgão>_<AAAAMM>_<página>.csv,
+        ou <órgão>_<AAAAMMDD-AAAAMMDD>_<página>.csv para as janelas de Window_planner)
+        para o dataset Parquet particionado por mês.
+        A conversão pode ser repetida: cada órgão/mês é gravado em um arquivo de nome fixo, que substitui
+        o da conversão anterior em vez de duplicar as linhas.
+        Args:
+            folder (str): pasta onde estão os CSVs
+            root (str): pasta raiz do dataset Parquet
+            remove (boolean): True para apagar os CSVs convertidos
+            log (object): instância do log a registrar mensagens de error, debug e warning
+        Returns:
+            quantidade de arquivos CSV convertidos
+    """
+    pattern = re.compile(r'^(\w+)_([0-9]{4})([0-9]{2}|[0-9]{4}-[0-9]{8})_([0-9]+)\.csv$')
+    files = []
+    for filename in sorted(os.listdir(folder)):
+        match = pattern.match(filename)
+        if match:
+            files.append((match.groups(), os.path.join(folder, filename)))
+
+    # agrupa por órgão/mês para gerar um arquivo por órgão/mês
+    files.sort(key=lambda f: (f[0][0], f[0][1], f[0][2], int(f[0][3])))
+    writer = Parquet_month_writer(root, batch_size=float('inf'), log=log, source='csv')
+    converted = []
+    last_key = None
+    for (org, year, month, page), filename in files:
+        if last_key and last_key != (org, year, month):
+            writer.flush()
+        last_key = (org, year, month)
+        df = pd.read_csv(filename, dtype=str, keep_default_na=False, na_values=[''])
+        header = [c for c in df.columns if c not in ('url', 'cod_orgao_superior', 'pagina')]
+        results = []
+        for row in df.to_dict('records'):
+            for h in header:
+                if h.lower().find('valor') != -1 and isinstance(row[h], str):
+                    row[h] = float(row[h])
+            results.append(row)
+        writer.write(org, year, month, int(page), header, results)
+        converted.append(filename)
+    writer.flush()
+
+    if remove:
+        for filename in converted:
+            os.remove(filename)
+    if log:
+        log.warning('{} arquivos CSV convertidos para {}'.format(len(converted), root))
+    return len(converted)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converte os CSVs de diárias por página para Parquet particionado por mês')
+    parser.add_argument('folder', nargs='?', default='.', help='pasta onde estão os CSVs')
+    parser.add_argument('root', nargs='?', default='diarias', help='pasta raiz do dataset Parquet')
+    parser.add_argument('--remove', action='store_true', help='apaga os CSVs convertidos')
+    args = parser.parse_args()
+    print('{} arquivos convertidos'.format(compact_csv(args.folder, args.root, args.remove)))
@@ -8,13 +8,102 @@
 __author__ = "Priscilla Lusie"
 __version__ = "1.0"
 
+import functools
 import re
-import requests
-from bs4 import BeautifulSoup
+import threading
+import time
+from .http_utils import Http_session
+
+
+@functools.lru_cache(maxsize=64)
+def compile_pattern(pattern, flags=re.MULTILINE):
+    """ Compila a expressão regular uma única vez, reaproveitando-a nas chamadas seguintes """
+    return re.compile(pattern, flags)
+
+
+class Html_response:
+    """
+        Resposta de uma página web que guarda o conteúdo bruto e só constrói o texto e a
+        estrutura html (BeautifulSoup) quando acessados pela primeira vez.
+        Assim, quem usa apenas expressões regulares nunca constrói a árvore do documento,
+        e o BeautifulSoup só é importado quando necessário.
+    """
+    def __init__(self, r, decode_content=False):
+        """
+            Args:
+                r (requests.Response): resposta retornada pela sessão HTTP
+                decode_content (boolean): True caso seja desejável a conversão para utf-8; Default False.
+        """
+        self.url = r.url
+        self.status_code = r.status_code
+        self.headers = r.headers
+        self.content = r.content
+        self.encoding = r.encoding
+        self.decode_content = decode_content
+        self.__text = None
+        self.__soup = None
+
+    @property
+    def text(self):
+        """ Conteúdo decodificado da página """
+        if self.__text is None:
+            if self.decode_content:
+                self.__text = str(self.content, 'utf-8', errors='replace')
+            elif self.encoding:
+                self.__text = str(self.content, self.encoding, errors='replace')
+            else:
+                from bs4.dammit import UnicodeDammit
+                self.__text = UnicodeDammit(self.content, is_html=True).unicode_markup
+        return self.__text
+
+    @property
+    def soup(self):
+        """ Conteúdo da página em estrutura html usando BeautifulSoup """
+        if self.__soup is None:
+            from bs4 import BeautifulSoup
+            self.__soup = BeautifulSoup(self.text if self.decode_content else self.content, 'lxml')
+        return self.__soup
+
+
+class default_instance_method:
+    """
+        Método de instância que, acessado pela própria classe, é executado na instância padrão
+        (Html_utils.default()). Mantém compatíveis as chamadas Html_utils.get_html(url), de quando
+        get_html era um staticmethod, enquanto as instâncias usam sua própria sessão e métricas.
+    """
+    def __init__(self, func):
+        self.func = func
+        functools.update_wrapper(self, func)
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            obj = Html_utils.default()
+        return self.func.__get__(obj)
+
 
 class Html_utils:
-    @staticmethod
-    def get_html(url, decode_content=False):
+    __default = None
+    __default_lock = threading.Lock()
+
+    def __init__(self, http=None, metrics=None):
+        """
+            Args:
+                http (Http_session): sessão HTTP usada nas requisições; se nula, usa a sessão padrão compartilhada
+                metrics (Metrics): coleta a latência e o tamanho das respostas; None para desativar
+        """
+        self.http = http or Http_session.default()
+        self.metrics = metrics
+
+    @classmethod
+    def default(cls):
+        """ Retorna a instância padrão, sem métricas e com a sessão padrão compartilhada """
+        with Html_utils.__default_lock:
+            if Html_utils.__default is None:
+                Html_utils.__default = Html_utils()
+            return Html_utils.__default
+
+    @default_instance_method
+    def get_html(self, url, decode_content=False):
         """ 
             Converte o resultado retornado pela URL em um estrutura html 
             Args:
@@ -23,12 +112,35 @@ class Html_utils:
             Returns:
                 Conteúdo retornado pela página em estrutura html usando BeautifulSoup
         """
-        r = requests.get(url)
-        if decode_content:
-            text = str(r.content, 'utf-8', errors='replace')
-        else:
-            text = r.content
-        return BeautifulSoup(text, 'lxml')
+        return self.fetch(url, decode_content).soup
+
+    @default_instance_method
+    def fetch(self, url, decode_content=False):
+        """
+            Faz a requisição à URL sem construir a estrutura html.
+            Args:
+                url (str): endereço completo da página a ser consultada
+                decode_content (boolean): True caso seja desejável a conversão para utf-8; Default False.
+            Returns:
+                objeto Html_response com o conteúdo bruto, o texto e a estrutura html construída sob demanda
+        """
+        return Html_response(self.get_response(url), decode_content)
+
+    def get_response(self, url):
+        """
+            Faz a requisição à URL usando a sessão HTTP configurada.
+            Args:
+                url (str): endereço completo da página a ser consultada
+            Returns:
+                objeto requests.Response
+        """
+        if not self.metrics:
+            return self.http.get(url)
+        start = time.perf_counter()
+        r = self.http.get(url)
+        self.metrics.observe('http_request_seconds', time.perf_counter() - start, {'status': str(r.status_code)}, url=url)
+        self.metrics.observe('http_response_bytes', len(r.content), url=url)
+        return r
 
     def scrape_from_tag(self, tag_name, tag_value, url, root_tag='div'):
         soup = self.get_html(url)
@@ -36,7 +148,17 @@ class Html_utils:
         return content
 
     def scrape_from_pattern(self, html, pattern, url=None):
+        """
+            Busca todas as ocorrências da expressão regular no texto da página.
+            Args:
+                html (str): texto onde a busca é feita; ignorado caso url seja informada
+                pattern (str ou re.Pattern): expressão regular; strings são compiladas uma única vez
+                url (str): página cujo texto bruto deve ser consultado, sem construir a estrutura html
+            Returns:
+                lista com as ocorrências encontradas
+        """
         if url:
-            html = str(self.get_html(url))
-        files = re.findall(pattern, html, re.MULTILINE)
-        return files
+            html = self.fetch(url).text
+        if isinstance(pattern, str):
+            pattern = compile_pattern(pattern)
+        return pattern.findall(html)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class Http_session:
+    """
+        Camada de transporte HTTP compartilhada pelos scrapers.
+        Mantém um pool de conexões keep-alive, envia Accept-Encoding gzip,
+        aplica timeout padrão e uma política de novas tentativas.
+    """
+    STATUS_FORCELIST = (429, 500, 502, 503, 504)
+
+    __default = {}
+    __default_lock = threading.Lock()
+
+    def __init__(self, pool_size=10, timeout=(10, 60), retries=3, backoff_factor=1,
+                 status_forcelist=None, headers=None, rate_limited=False):
+        """
+            Args:
+                pool_size (int): quantidade de conexões mantidas abertas por host
+                timeout (float ou tuple): timeout padrão (conexão, leitura) em segundos
+                retries (int): quantidade de novas tentativas em caso de erro de conexão ou status em status_forcelist
+                backoff_factor (float): fator de espera exponencial entre as tentativas
+                status_forcelist (tuple): status HTTP que disparam uma nova tentativa; default STATUS_FORCELIST,
+                    sem o 429 caso rate_limited
+                headers (dict): cabeçalhos adicionais enviados em todas as requisições
+                rate_limited (boolean): True caso as respostas passem por um controle de taxa (ver rate_limiter.py).
+                    O 429 precisa chegar ao controle de taxa para que ele reduza a taxa; com novas tentativas
+                    automáticas, o servidor limitaria as requisições sem que o controle de taxa percebesse.
+                    Pelo mesmo motivo o Retry-After não dispara novas tentativas, já que o urllib3 repete as
+                    respostas 429 com Retry-After mesmo fora de status_forcelist.
+        """
+        if status_forcelist is None:
+            status_forcelist = tuple(s for s in self.STATUS_FORCELIST if not (rate_limited and s == 429))
+        self.timeout = timeout
+        self.rate_limited = rate_limited
+        self.status_forcelist = status_forcelist
+        retry = Retry(total=retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=status_forcelist,
+                      allowed_methods=frozenset(['GET', 'HEAD']),
+                      respect_retry_after_header=not rate_limited,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+        if headers:
+            self.session.headers.update(headers)
+
+    @classmethod
+    def default(cls, rate_limited=False):
+        """
+            Retorna a sessão padrão, compartilhada por todas as instâncias que não informarem uma sessão própria.
+            Args:
+                rate_limited (boolean): True para a sessão padrão dos scrapers com controle de taxa, sem novas
+                    tentativas automáticas em respostas 429
+        """
+        with cls.__default_lock:
+            if rate_limited not in cls.__default:
+                cls.__default[rate_limited] = cls(rate_limited=rate_limited)
+            return cls.__default[rate_limited]
+
+    def get(self, url, **kwargs):
+        """
+            Faz uma requisição GET usando o pool de conexões.
+            Args:
+                url (str): endereço a ser consultado
+                kwargs: demais argumentos aceitos por requests.Session.get (params, stream, headers, timeout...)
+            Returns:
+                objeto requests.Response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def close(self):
+        """ Fecha as conexões abertas """
+        self.session.close()
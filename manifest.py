@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class Download_manifest:
+    """
+        Manifesto local (SQLite) dos arquivos baixados.
+        Guarda, para cada arquivo, os parâmetros usados no download, os validadores HTTP (ETag e Last-Modified),
+        o tamanho, o checksum e a data do download, permitindo requisições condicionais nas execuções seguintes.
+    """
+    COLUMNS = ['filename', 'base', 'params', 'etag', 'last_modified', 'size', 'checksum', 'fetched_at', 'checked_at']
+
+    def __init__(self, path='manifest.sqlite'):
+        """
+            Args:
+                path (str): caminho do arquivo SQLite do manifesto
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS files (
+                                     filename TEXT PRIMARY KEY,
+                                     base TEXT,
+                                     params TEXT,
+                                     etag TEXT,
+                                     last_modified TEXT,
+                                     size INTEGER,
+                                     checksum TEXT,
+                                     fetched_at TEXT,
+                                     checked_at TEXT)''')
+
+    def get(self, filename):
+        """
+            Args:
+                filename (str): nome do arquivo baixado
+            Returns:
+                dicionário com as informações do arquivo ou None caso ele não esteja no manifesto
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT {} FROM files WHERE filename = ?'.format(', '.join(self.COLUMNS)),
+                                    (filename,)).fetchone()
+        if not row:
+            return None
+        info = dict(zip(self.COLUMNS, row))
+        info['params'] = json.loads(info['params']) if info['params'] else None
+        return info
+
+    def conditional_headers(self, filename):
+        """
+            Monta os cabeçalhos If-None-Match/If-Modified-Since a partir dos validadores registrados.
+            Returns:
+                dicionário de cabeçalhos; vazio caso o arquivo não esteja no manifesto
+        """
+        info = self.get(filename)
+        headers = {}
+        if info and info['etag']:
+            headers['If-None-Match'] = info['etag']
+        if info and info['last_modified']:
+            headers['If-Modified-Since'] = info['last_modified']
+        return headers
+
+    def update(self, filename, base, params, info):
+        """
+            Registra um arquivo recém-baixado.
+            Args:
+                filename (str): nome do arquivo baixado
+                base (str): nome da base a que o arquivo pertence
+                params (dict): parâmetros usados no download (ano, mês, dia, tipo, origem...)
+                info (dict): informações retornadas por File_utils.download_file_from_url
+        """
+        now = datetime.now().isoformat()
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO files ({}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'.format(', '.join(self.COLUMNS)),
+                              (filename, base, json.dumps(params, sort_keys=True) if params else None,
+                               info.get('etag'), info.get('last_modified'), info.get('size'), info.get('checksum'),
+                               now, now))
+
+    def touch(self, filename):
+        """ Registra que o arquivo foi conferido e não mudou no servidor """
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE files SET checked_at = ? WHERE filename = ?', (datetime.now().isoformat(), filename))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
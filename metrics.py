@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import json
+import os
+import threading
+import time
+
+
+class Jsonl_sink:
+    """ Grava cada evento de métrica como uma linha JSON em um arquivo """
+    def __init__(self, path):
+        """
+            Args:
+                path (str): caminho do arquivo, aberto para acréscimo
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def __call__(self, event):
+        line = json.dumps(event, ensure_ascii=False, default=str) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class Metrics:
+    """
+        Coleta métricas de desempenho dos scrapers: latência e bytes das requisições, vazão de cada download,
+        tempo de extração e de gravação, tempo dormindo no controle de taxa, novas tentativas e CAPTCHAs.
+        Cada medida é repassada, como um dicionário, a cada um dos sinks (funções que recebem o evento, como
+        Jsonl_sink) e acumulada para exportação no formato texto do Prometheus.
+        As classes instrumentadas só chamam os métodos desta classe quando recebem uma instância;
+        sem métricas, o custo se resume a um teste de None.
+    """
+    def __init__(self, sinks=(), prefix='transparencia_'):
+        """
+            Args:
+                sinks (list): funções sink(evento) chamadas a cada medida; o evento é um dicionário com
+                    'time', 'type' ('counter' ou 'summary'), 'name', 'value', 'labels' e detalhes opcionais
+                prefix (str): prefixo dos nomes das métricas exportadas para o Prometheus
+        """
+        if callable(sinks):
+            sinks = [sinks]
+        self.sinks = list(sinks)
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.summaries = {}
+
+    @staticmethod
+    def __key(name, labels):
+        return name, tuple(sorted(labels.items())) if labels else ()
+
+    def __emit(self, kind, name, value, labels, details):
+        if not self.sinks:
+            return
+        event = {'time': time.time(), 'type': kind, 'name': name, 'value': value, 'labels': labels or {}}
+        if details:
+            event.update(details)
+        for sink in self.sinks:
+            sink(event)
+
+    def increment(self, name, value=1, labels=None, **details):
+        """
+            Incrementa um contador.
+            Args:
+                name (str): nome da métrica, ex.: 'captcha_total'
+                value (float): incremento
+                labels (dict): rótulos de baixa cardinalidade, exportados para o Prometheus
+                details: informações adicionais repassadas apenas aos sinks (ex.: url, nome do arquivo)
+        """
+        key = self.__key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.__emit('counter', name, value, labels, details)
+
+    def observe(self, name, value, labels=None, **details):
+        """
+            Registra uma observação (duração em segundos, bytes...), acumulando quantidade, soma e máximo.
+            Args: ver increment
+        """
+        key = self.__key(name, labels)
+        with self.lock:
+            summary = self.summaries.get(key)
+            if summary is None:
+                self.summaries[key] = [1, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                summary[2] = max(summary[2], value)
+        self.__emit('summary', name, value, labels, details)
+
+    def snapshot(self):
+        """
+            Returns:
+                dicionário {'counters': {...}, 'summaries': {...}} com os valores acumulados,
+                indexados por (nome, rótulos)
+        """
+        with self.lock:
+            return {'counters': dict(self.counters),
+                    'summaries': {key: tuple(value) for key, value in self.summaries.items()}}
+
+    @staticmethod
+    def __labels(labels, extra=()):
+        labels = list(labels) + list(extra)
+        if not labels:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels) + '}'
+
+    def to_prometheus(self):
+        """
+            Returns:
+                texto no formato de exposição do Prometheus: contadores como counter e observações
+                como summary (_count e _sum), além de um gauge _max
+        """
+        data = self.snapshot()
+        lines = []
+        for kind, values in (('counter', data['counters']), ('summary', data['summaries'])):
+            names = sorted({name for name, _ in values})
+            for name in names:
+                metric = self.prefix + name
+                lines.append('# TYPE {} {}'.format(metric, kind))
+                for (n, labels), value in sorted(values.items()):
+                    if n != name:
+                        continue
+                    if kind == 'counter':
+                        lines.append('{}{} {}'.format(metric, self.__labels(labels), value))
+                    else:
+                        lines.append('{}_count{} {}'.format(metric, self.__labels(labels), value[0]))
+                        lines.append('{}_sum{} {}'.format(metric, self.__labels(labels), value[1]))
+            if kind == 'summary':
+                for name in names:
+                    metric = self.prefix + name + '_max'
+                    lines.append('# TYPE {} gauge'.format(metric))
+                    for (n, labels), value in sorted(values.items()):
+                        if n == name:
+                            lines.append('{}{} {}'.format(metric, self.__labels(labels), value[2]))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """ Grava o texto do Prometheus em path, de forma atômica (ex.: para o textfile collector do node_exporter) """
+        with open(path + '.part', 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(path + '.part', path)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+# Cabeçalhos que deixam de valer pois o corpo é arquivado já descomprimido
+DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+class Not_archived_error(IOError):
+    """ A página pedida não está no arquivo """
+    pass
+
+
+def get_request_url(url, params=None):
+    """ Monta a url completa da requisição, com os parâmetros, usada como chave do arquivo """
+    return requests.Request('GET', url.strip(), params=params).prepare().url
+
+
+class Page_archive:
+    """
+        Arquivo de páginas no estilo WARC: um arquivo por execução, em que cada resposta é gravada
+        como um membro gzip independente, apenas acrescentado ao final do arquivo.
+        Um índice em '<arquivo>.idx' (JSON por linha) guarda url, data, status, posição e tamanho de cada registro.
+    """
+    def __init__(self, path=None, folder='.'):
+        """
+            Args:
+                path (str): caminho do arquivo; se nulo, cria 'crawl-<data e hora>.warc.gz' em folder
+                folder (str): pasta onde o arquivo é criado quando path não é informado
+        """
+        if not path:
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, 'crawl-{}.warc.gz'.format(time.strftime('%Y%m%d%H%M%S')))
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'ab')
+        self.index = open(path + '.idx', 'a')
+
+    def add(self, url, r):
+        """
+            Acrescenta uma resposta ao arquivo.
+            Args:
+                url (str): url completa da requisição (ver get_request_url)
+                r (requests.Response): resposta, com o conteúdo já lido
+        """
+        date = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        http = ['HTTP/1.1 {} {}'.format(r.status_code, r.reason or '')]
+        http += ['{}: {}'.format(k, v) for k, v in r.headers.items() if k.lower() not in DROPPED_HEADERS]
+        block = ('\r\n'.join(http) + '\r\n\r\n').encode('latin-1', errors='replace') + r.content
+        warc = ['WARC/1.0',
+                'WARC-Type: response',
+                'WARC-Record-ID: <urn:uuid:{}>'.format(uuid.uuid4()),
+                'WARC-Date: {}'.format(date),
+                'WARC-Target-URI: {}'.format(url),
+                'Content-Type: application/http; msgtype=response',
+                'Content-Length: {}'.format(len(block))]
+        record = gzip.compress(('\r\n'.join(warc) + '\r\n\r\n').encode('utf-8') + block + b'\r\n\r\n')
+
+        with self.lock:
+            offset = self.file.tell()
+            self.file.write(record)
+            self.file.flush()
+            self.index.write(json.dumps({'url': url, 'date': date, 'status': r.status_code,
+                                         'offset': offset, 'length': len(record)}) + '\n')
+            self.index.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.index.close()
+
+
+class Recording_session:
+    """
+        Sessão HTTP que grava em um Page_archive todas as páginas obtidas, repassando as requisições
+        para a sessão original. Requisições em stream (downloads de arquivos) não são arquivadas.
+    """
+    def __init__(self, http, archive):
+        """
+            Args:
+                http (Http_session): sessão que faz as requisições de fato
+                archive (Page_archive): arquivo onde as páginas são gravadas
+        """
+        self.http = http
+        self.archive = archive
+
+    def get(self, url, **kwargs):
+        r = self.http.get(url, **kwargs)
+        if not kwargs.get('stream'):
+            self.archive.add(get_request_url(url, kwargs.get('params')), r)
+        return r
+
+    def close(self):
+        self.archive.close()
+
+
+class Replay_session:
+    """
+        Sessão HTTP que responde com as páginas de um ou mais Page_archive, sem acesso à rede.
+        Quando uma url foi arquivada mais de uma vez, a versão mais recente é usada.
+    """
+    def __init__(self, paths):
+        """
+            Args:
+                paths (str ou list): arquivo(s) .warc.gz gravados por Page_archive
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        self.lock = threading.Lock()
+        self.files = {}
+        self.records = {}
+        for path in paths:
+            with open(path + '.idx') as index:
+                for line in index:
+                    record = json.loads(line)
+                    record['path'] = path
+                    last = self.records.get(record['url'])
+                    if not last or last['date'] <= record['date']:
+                        self.records[record['url']] = record
+
+    def __read(self, record):
+        with self.lock:
+            f = self.files.get(record['path'])
+            if f is None:
+                f = self.files[record['path']] = open(record['path'], 'rb')
+            f.seek(record['offset'])
+            data = f.read(record['length'])
+        return gzip.decompress(data)
+
+    def get(self, url, params=None, **kwargs):
+        """
+            Retorna a página arquivada como um requests.Response.
+            Exception:
+                Not_archived_error caso a url não esteja no arquivo
+        """
+        request_url = get_request_url(url, params)
+        record = self.records.get(request_url)
+        if record is None:
+            raise Not_archived_error('Página não encontrada no arquivo: {}'.format(request_url))
+
+        data = self.__read(record)
+        _, block = data.split(b'\r\n\r\n', 1)
+        head, body = block.split(b'\r\n\r\n', 1)
+        lines = head.decode('latin-1').split('\r\n')
+
+        r = requests.models.Response()
+        status = lines[0].split(' ', 2)
+        r.status_code = int(status[1])
+        r.reason = status[2] if len(status) > 2 else ''
+        r.headers = CaseInsensitiveDict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+        r._content = body[:-4] if body.endswith(b'\r\n\r\n') else body
+        r.encoding = get_encoding_from_headers(r.headers)
+        r.url = request_url
+        return r
+
+    def close(self):
+        with self.lock:
+            for f in self.files.values():
+                f.close()
+            self.files = {}
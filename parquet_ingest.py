@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def get_type(column):
+    """
+        Tipo Arrow de uma coluna dos CSVs do portal, a partir apenas do seu nome: float64 para as colunas
+        cujo nome contém 'VALOR', data (timestamp) para as que começam com 'DATA' e texto para as demais.
+    """
+    name = column.strip().upper()
+    if 'VALOR' in name:
+        return pa.float64()
+    if name.startswith('DATA'):
+        return pa.timestamp('ns')
+    return pa.string()
+
+
+def get_schema(columns):
+    """
+        Monta o schema de um CSV a partir dos nomes das colunas (ver get_type), e não dos valores do primeiro
+        bloco: uma coluna vazia ou só com números no primeiro bloco continua sendo texto nos demais.
+    """
+    return pa.schema([pa.field(c.strip(), get_type(c)) for c in columns])
+
+
+def normalize_chunk(df, invalid=None):
+    """
+        Normaliza os tipos de um bloco lido dos CSVs do portal, segundo get_type.
+        Colunas de valor são convertidas do formato brasileiro (1.234,56) para float,
+        colunas de data são convertidas de dd/mm/aaaa para data e as demais permanecem texto.
+        Valores preenchidos que não puderem ser convertidos ficam nulos e são contados em invalid.
+        Args:
+            df (pandas.DataFrame): bloco lido com todas as colunas como texto
+            invalid (dict): acumula, por coluna, a quantidade de valores preenchidos que ficaram nulos
+        Returns:
+            DataFrame com os tipos normalizados
+    """
+    df.columns = [c.strip() for c in df.columns]
+    for column in df.columns:
+        column_type = get_type(column)
+        filled = df[column].notna()
+        if column_type == pa.float64():
+            values = df[column].str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+            df[column] = pd.to_numeric(values, errors='coerce').astype('float64')
+        elif column_type == pa.timestamp('ns'):
+            df[column] = pd.to_datetime(df[column], format='%d/%m/%Y', errors='coerce')
+        else:
+            continue
+        lost = int((filled & df[column].isna()).sum())
+        if lost and invalid is not None:
+            invalid[column] = invalid.get(column, 0) + lost
+    return df
+
+
+def zip_to_parquet(zip_filename, folder, chunksize=100000, encoding='latin-1', sep=';'):
+    """
+        Converte cada CSV de um arquivo zip em um arquivo Parquet, lendo o CSV em blocos
+        para que o uso de memória seja limitado ao tamanho de um bloco.
+        Os arquivos Parquet são nomeados <nome do zip>_<nome do CSV>.parquet, para que os zips de uma
+        mesma partição (ex.: os arquivos diários de um mês) não sobrescrevam uns aos outros.
+        Args:
+            zip_filename (str): arquivo zip baixado do portal
+            folder (str): pasta da partição onde os arquivos Parquet serão gravados
+            chunksize (int): quantidade de linhas lidas por bloco
+            encoding (str): codificação dos CSVs
+            sep (str): separador dos CSVs
+        Returns:
+            lista com os arquivos Parquet gravados
+            dicionário {arquivo Parquet: {coluna: quantidade}} com os valores preenchidos no CSV que não puderam
+            ser convertidos e foram gravados como nulos (ver normalize_chunk)
+    """
+    os.makedirs(folder, exist_ok=True)
+    written = []
+    invalid = {}
+    with zipfile.ZipFile(zip_filename) as z:
+        for member in z.infolist():
+            if member.is_dir() or not member.filename.lower().endswith(('.csv', '.txt')):
+                continue
+            filename = os.path.join(folder, '{}_{}.parquet'.format(os.path.splitext(os.path.basename(zip_filename))[0],
+                                                                      os.path.splitext(os.path.basename(member.filename))[0]))
+            part_filename = filename + '.part'
+            writer = None
+            member_invalid = {}
+            try:
+                with z.open(member) as f:
+                    reader = pd.read_csv(f, sep=sep, encoding=encoding, dtype=str, chunksize=chunksize,
+                                         keep_default_na=False, na_values=[''])
+                    for chunk in reader:
+                        if writer is None:
+                            writer = pq.ParquetWriter(part_filename, get_schema(chunk.columns))
+                        writer.write_table(pa.Table.from_pandas(normalize_chunk(chunk, member_invalid), preserve_index=False,
+                                                                schema=writer.schema))
+            finally:
+                if writer:
+                    writer.close()
+            if writer:
+                os.replace(part_filename, filename)
+                written.append(filename)
+                if member_invalid:
+                    invalid[filename] = member_invalid
+    return written, invalid
+
+
+class Parquet_ingestor:
+    """
+        Etapa opcional, executada após o download, que converte os zips das bases em Parquet
+        particionado por base/ano/mês: <output>/<base>/ano=AAAA/mes=MM/<zip>_<csv>.parquet.
+        As conversões são executadas em paralelo em um pool de processos.
+    """
+    def __init__(self, output='parquet', workers=None, chunksize=100000, encoding='latin-1', sep=';', log=None):
+        """
+            Args:
+                output (str): pasta raiz dos arquivos Parquet
+                workers (int): quantidade de processos; se nulo, a quantidade de CPUs
+                chunksize (int): quantidade de linhas lidas por bloco de cada CSV
+                encoding (str): codificação dos CSVs
+                sep (str): separador dos CSVs
+                log (object): instância do log a registrar mensagens de error, debug e warning
+        """
+        self.output = output
+        self.chunksize = chunksize
+        self.encoding = encoding
+        self.sep = sep
+        self.log = log
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.futures = {}
+
+    def get_folder(self, params, zip_filename):
+        """
+            Monta a pasta da partição do arquivo.
+            Args:
+                params (dict): parâmetros do download (a = ano, m = mês)
+                zip_filename (str): nome do arquivo zip, cuja pasta é o nome da base
+            Returns:
+                pasta de destino dos arquivos Parquet
+        """
+        folder = os.path.join(self.output, os.path.basename(os.path.dirname(zip_filename)) or 'base')
+        if params and params.get('a'):
+            folder = os.path.join(folder, 'ano={}'.format(params['a']))
+        if params and params.get('m'):
+            folder = os.path.join(folder, 'mes={}'.format(params['m']))
+        return folder
+
+    def submit(self, params, zip_filename):
+        """
+            Agenda a conversão de um arquivo zip.
+            Args:
+                params (dict): parâmetros do download, usados no particionamento
+                zip_filename (str): arquivo zip baixado
+            Returns:
+                concurrent.futures.Future com o resultado de zip_to_parquet
+        """
+        future = self.executor.submit(zip_to_parquet, zip_filename, self.get_folder(params, zip_filename),
+                                      self.chunksize, self.encoding, self.sep)
+        self.futures[future] = zip_filename
+        return future
+
+    def wait(self):
+        """
+            Aguarda as conversões agendadas.
+            Returns:
+                Dicionário {arquivo zip: exceção} com as conversões que falharam
+        """
+        errors = {}
+        futures, self.futures = self.futures, {}
+        for future, zip_filename in futures.items():
+            try:
+                written, invalid = future.result()
+                if self.log:
+                    self.log.warning('{} convertido em {} arquivos Parquet'.format(zip_filename, len(written)))
+                    for filename, columns in invalid.items():
+                        for column, count in columns.items():
+                            self.log.error('{}: {} valores da coluna {} não convertidos, gravados como nulos'.format(
+                                filename, count, column))
+            except Exception as e:
+                if self.log:
+                    self.log.error('Erro ao converter {}: {}'.format(zip_filename, e))
+                errors[zip_filename] = e
+        return errors
+
+    def close(self):
+        self.executor.shutdown()
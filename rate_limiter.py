@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import threading
+import time
+
+
+class Fixed_rate_limiter:
+    """
+        Controle de taxa com intervalo fixo entre as requisições.
+        Os controles de taxa implementam acquire (chamado antes de cada requisição),
+        success e failure (chamados depois, com o resultado da requisição) e expõem a taxa atual em rate.
+        Podem ser compartilhados entre threads.
+    """
+    def __init__(self, sleep_time=30):
+        """
+            Args:
+                sleep_time (float): intervalo, em segundos, entre o início de duas requisições
+        """
+        self.sleep_time = sleep_time
+        self.lock = threading.Lock()
+        self.next_time = 0
+
+    @property
+    def rate(self):
+        """ Taxa atual em requisições por segundo """
+        return 1.0 / self.sleep_time if self.sleep_time else float('inf')
+
+    def acquire(self):
+        """
+            Aguarda até que uma nova requisição seja permitida.
+            Returns:
+                tempo, em segundos, que a chamada ficou aguardando
+        """
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.sleep_time
+        wait = start - now
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def success(self, elapsed):
+        """
+            Registra uma resposta saudável.
+            Args:
+                elapsed (float): tempo de resposta da requisição em segundos
+        """
+        pass
+
+    def failure(self, reason):
+        """
+            Registra uma resposta que indica sobrecarga do servidor (CAPTCHA, 429, 5xx...).
+            Args:
+                reason (str): motivo da falha, usado apenas para log
+        """
+        pass
+
+
+class Aimd_rate_limiter(Fixed_rate_limiter):
+    """
+        Controle de taxa adaptativo: token bucket cuja taxa cresce de forma aditiva enquanto as respostas
+        são saudáveis e cai de forma multiplicativa (AIMD) quando o servidor responde com CAPTCHA, 429,
+        erro ou demora mais que slow_threshold.
+    """
+    def __init__(self, rate=1/30., min_rate=1/300., max_rate=1., increase=0.005, decrease=0.5,
+                 slow_threshold=10, burst=1, log=None):
+        """
+            Args:
+                rate (float): taxa inicial em requisições por segundo
+                min_rate (float): taxa mínima
+                max_rate (float): taxa máxima
+                increase (float): acréscimo à taxa a cada resposta saudável
+                decrease (float): fator multiplicado à taxa a cada falha ou resposta lenta
+                slow_threshold (float): tempo de resposta, em segundos, a partir do qual a resposta é considerada lenta
+                burst (int): quantidade de requisições que podem ser feitas em sequência sem espera
+                log (object): instância do log a registrar as mudanças de taxa
+        """
+        Fixed_rate_limiter.__init__(self, 1.0 / rate)
+        self.current_rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_threshold = slow_threshold
+        self.burst = burst
+        self.log = log
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self):
+        return self.current_rate
+
+    def __refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.current_rate)
+        self.updated = now
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.__refill(now)
+            self.tokens -= 1
+            wait = -self.tokens / self.current_rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def success(self, elapsed):
+        if self.slow_threshold and elapsed > self.slow_threshold:
+            self.failure('resposta lenta ({:.1f}s)'.format(elapsed))
+            return
+        with self.lock:
+            self.__refill(time.monotonic())
+            self.current_rate = min(self.max_rate, self.current_rate + self.increase)
+            self.sleep_time = 1.0 / self.current_rate
+
+    def failure(self, reason):
+        with self.lock:
+            self.__refill(time.monotonic())
+            self.current_rate = max(self.min_rate, self.current_rate * self.decrease)
+            self.sleep_time = 1.0 / self.current_rate
+            # descarta a reserva acumulada para que a próxima requisição aguarde o novo intervalo
+            self.tokens = min(self.tokens, 0)
+        if self.log:
+            self.log.warning('Reduzindo a taxa de requisições para {:.4f}/s: {}'.format(self.current_rate, reason))
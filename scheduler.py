@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import queue
+import threading
+import time
+
+
+class Work_scheduler:
+    """
+        Executa itens de trabalho em um pool de threads.
+        Cada item é processado por handler(item, scheduler), que pode agendar novos itens com put
+        e pausar todo o pool com pause. Um item cujo handler lança exceção é reagendado
+        até 'retries' vezes, sem afetar os demais.
+        Um handler que delega parte do trabalho a outra thread ou processo chama begin antes de retornar
+        e end quando o trabalho delegado terminar (ou retry, em caso de falha); run só retorna depois disso.
+    """
+    def __init__(self, handler, workers=1, retries=3, log=None, metrics=None):
+        """
+            Args:
+                handler (function): função handler(item, scheduler) que processa um item
+                workers (int): quantidade de threads
+                retries (int): quantidade de novas tentativas de um item que falhou
+                log (object): instância do log a registrar mensagens de error, debug e warning
+                metrics (Metrics): conta as novas tentativas; None para desativar
+        """
+        self.handler = handler
+        self.workers = workers
+        self.retries = retries
+        self.log = log
+        self.metrics = metrics
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.pending = 0
+        self.attempts = {}
+        self.failures = {}
+        self.paused_until = 0
+
+    def put(self, item):
+        """ Agenda um item de trabalho """
+        self.begin()
+        self.queue.put(item)
+
+    def begin(self):
+        """ Registra um trabalho em andamento, que deve ser concluído com end """
+        with self.condition:
+            self.pending += 1
+
+    def end(self):
+        """ Conclui um trabalho registrado com begin ou put """
+        with self.condition:
+            self.pending -= 1
+            if not self.pending:
+                self.condition.notify_all()
+
+    def retry(self, item, error):
+        """
+            Registra a falha de um item e o reagenda, caso ainda haja tentativas.
+            Args:
+                item: item que falhou
+                error (Exception): erro ocorrido
+            Returns:
+                True caso o item tenha sido reagendado
+        """
+        with self.lock:
+            attempts = self.attempts.get(item, 0) + 1
+            self.attempts[item] = attempts
+            if attempts > self.retries:
+                self.failures[item] = error
+        if self.metrics:
+            self.metrics.increment('retries_total', labels={'final': str(attempts > self.retries).lower()}, item=str(item), error=str(error))
+        if attempts > self.retries:
+            if self.log:
+                self.log.error('Item {} falhou após {} tentativas: {}'.format(item, attempts, error))
+            return False
+        if self.log:
+            self.log.warning('Item {} falhou ({}), nova tentativa {} de {}'.format(item, error, attempts, self.retries))
+        self.put(item)
+        return True
+
+    def pause(self, seconds):
+        """ Pausa todas as threads por 'seconds' segundos; os itens em andamento não são interrompidos """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        if self.log:
+            self.log.warning('Pausando o processamento por {} segundos'.format(seconds))
+
+    def __wait_pause(self):
+        while True:
+            with self.lock:
+                wait = self.paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def __work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            try:
+                self.__wait_pause()
+                self.handler(item, self)
+            except Exception as e:
+                self.retry(item, e)
+            finally:
+                self.end()
+
+    def run(self, items=()):
+        """
+            Processa os itens informados e os que forem agendados durante o processamento.
+            Args:
+                items (iterable): itens de trabalho iniciais
+            Returns:
+                Dicionário {item: exceção} com os itens que falharam após todas as tentativas
+        """
+        for item in items:
+            self.put(item)
+        threads = [threading.Thread(target=self.__work, daemon=True) for _ in range(max(1, self.workers))]
+        for t in threads:
+            t.start()
+        with self.condition:
+            while self.pending:
+                self.condition.wait()
+        for _ in threads:
+            self.queue.put(None)
+        for t in threads:
+            t.join()
+        return self.failures
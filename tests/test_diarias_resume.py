@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from ..checkpoint import Diarias_checkpoint
+from ..diarias_scraper import Diarias_Scraper
+
+
+class Fake_scheduler:
+    def __init__(self):
+        self.items = []
+
+    def put(self, item):
+        self.items.append(item)
+
+
+class Resume_test(unittest.TestCase):
+    """ Retomada de um mês cuja quantidade de páginas está no checkpoint, mas a página 1 não foi concluída """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.folder)
+        self.checkpoint = Diarias_checkpoint(os.path.join(self.folder, 'checkpoint.sqlite'))
+        self.checkpoint.start_month('1', '201701', 5)
+        self.checkpoint.page_done('1', '201701', 2)
+        self.scrap = Diarias_Scraper(checkpoint=self.checkpoint, sleep_time=0)
+        self.date_in, self.date_out = datetime(2017, 1, 1), datetime(2017, 1, 31)
+
+    def tearDown(self):
+        self.checkpoint.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder)
+
+    def test_each_page_is_scheduled_once(self):
+        items = self.scrap.get_pending_items(['1'], [self.date_in], [self.date_out])
+        self.assertEqual(items, [('1', self.date_in, self.date_out, 1)])
+
+        scheduler = Fake_scheduler()
+        header = ['Documento', 'Valor']
+        results = [{'Documento': 'D1', 'Valor': 1.0, 'url': 'u', 'cod_orgao_superior': '1'}]
+        self.scrap.handle_page(items[0], header, results, [('1', '5')], scheduler)
+        self.assertEqual([item[3] for item in scheduler.items], [3, 4, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,29 +8,289 @@
 __author__ = "Priscilla Lusie"
 __version__ = "1.1"
 
+import collections
+import hashlib
+import io
 import os
 import re
 import requests
 import signal
+import socket
 import stat
 import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import formatdate, parsedate
 from urllib.parse import urlparse, parse_qs
 from .html_utils import Html_utils
+from .http_utils import Http_session
+from .catalog import Schema_catalog
+from .manifest import Download_manifest
+from .page_archive import Replay_session
+from .work_queue import Queue_worker
 
 
 def handler_ctrlz(signum, frame):
     print('Operacao interrompida pelo usuario')
     sys.exit(0)
-signal.signal(signal.SIGTSTP, handler_ctrlz)
-    
+
+
+def install_interrupt_handler():
+    """
+        Faz com que Ctrl+Z (SIGTSTP) encerre o processo. Opcional: deve ser chamado pela aplicação,
+        na thread principal, e não é instalado ao importar a biblioteca.
+    """
+    signal.signal(signal.SIGTSTP, handler_ctrlz)
+
+
+class Download_progress:
+    """
+        Acompanha o progresso de vários downloads simultâneos.
+        Em vez da barra única de check_progress, registra no log o andamento de cada arquivo
+        a cada 'step' por cento e mantém o total de bytes baixados por todos os downloads.
+    """
+    def __init__(self, log=None, step=10):
+        """
+            Args:
+                log (object): instância do log a registrar o progresso; se nulo, usa print
+                step (int): intervalo, em porcentagem, entre dois registros de um mesmo arquivo
+        """
+        self.log = log
+        self.step = step
+        self.lock = threading.Lock()
+        self.files = {}
+        self.loaded = 0
+
+    def __print(self, msg):
+        if self.log:
+            self.log.warning(msg)
+        else:
+            print(msg)
+
+    def update(self, filename, complete, total):
+        """
+            Atualiza o progresso de um arquivo.
+            Args:
+                filename (str): nome do arquivo sendo baixado
+                complete (int): bytes já baixados do arquivo
+                total (int): tamanho total do arquivo; 0 caso desconhecido
+        """
+        with self.lock:
+            last_complete, last_mark = self.files.get(filename, (0, -1))
+            self.loaded += complete - last_complete
+            mark = int(100 * complete / total) // self.step if total else last_mark
+            self.files[filename] = (complete, mark)
+            active = len(self.files)
+        if mark != last_mark:
+            self.__print('{}: {}% [{} arquivos em andamento]'.format(filename, mark * self.step, active))
+
+    def finish(self, filename):
+        """ Remove o arquivo da lista de downloads em andamento """
+        with self.lock:
+            self.files.pop(filename, None)
+
+
+class Host_limiter:
+    """ Limita a quantidade de downloads simultâneos por servidor """
+    def __init__(self, limit):
+        """
+            Args:
+                limit (int): quantidade máxima de downloads simultâneos em um mesmo host
+        """
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.semaphores = {}
+
+    def get(self, url):
+        """ Retorna o semáforo associado ao host da url, criando-o caso ainda não exista """
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self.semaphores[host]
+
+
+class Stall_error(IOError):
+    """ O download ficou abaixo da vazão mínima durante toda a janela de observação """
+    pass
+
+
+class Stall_watchdog:
+    """
+        Detecta downloads travados em qualquer thread, sem sinais.
+        Uma thread de monitoramento amostra, a cada 'interval' segundos, o total de bytes de cada download
+        registrado; se em uma janela de 'window' segundos a vazão ficar abaixo de min_rate, o socket do download
+        é fechado, o que interrompe a leitura bloqueada na thread que faz o download.
+        A ausência total de dados é detectada antes, pelo timeout de leitura do socket (ver Http_session).
+    """
+    def __init__(self, min_rate=1024, window=300, interval=1, log=None, metrics=None):
+        """
+            Args:
+                min_rate (float): vazão mínima, em bytes por segundo
+                window (float): janela, em segundos, em que a vazão é medida
+                interval (float): intervalo, em segundos, entre as amostras
+                log (object): instância do log a registrar mensagens de error, debug e warning
+                metrics (Metrics): conta os downloads interrompidos; None para desativar
+        """
+        self.min_rate = min_rate
+        self.window = window
+        self.interval = interval
+        self.log = log
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.transfers = set()
+        self.thread = None
+
+    class Transfer:
+        """ Download monitorado; a thread do download apenas soma os bytes recebidos em 'total' """
+        def __init__(self, name, r):
+            self.name = name
+            self.response = r
+            connection = getattr(r.raw, 'connection', None)
+            self.sock = getattr(connection, 'sock', None)
+            self.total = 0
+            self.samples = collections.deque()
+            self.stalled = False
+
+        def abort(self):
+            self.stalled = True
+            try:
+                if self.sock is not None:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                else:
+                    self.response.close()
+            except OSError:
+                pass
+
+    def watch(self, name, r):
+        """
+            Passa a monitorar um download.
+            Args:
+                name (str): nome do arquivo, usado nas mensagens
+                r (requests.Response): resposta em stream, ainda não consumida
+            Returns:
+                Transfer cujo atributo 'total' deve ser incrementado a cada bloco recebido
+        """
+        transfer = self.Transfer(name, r)
+        with self.lock:
+            self.transfers.add(transfer)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.__monitor, daemon=True)
+                self.thread.start()
+        return transfer
+
+    def unwatch(self, transfer):
+        with self.lock:
+            self.transfers.discard(transfer)
+
+    def __monitor(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.transfers:
+                    self.thread = None
+                    return
+                transfers = list(self.transfers)
+            now = time.monotonic()
+            for transfer in transfers:
+                transfer.samples.append((now, transfer.total))
+                # mantém apenas a amostra mais recente anterior ao início da janela
+                while len(transfer.samples) > 1 and transfer.samples[1][0] <= now - self.window:
+                    transfer.samples.popleft()
+                start, total = transfer.samples[0]
+                if now - start >= self.window and transfer.total - total < self.min_rate * (now - start):
+                    if self.log:
+                        self.log.error('Download de {} travado: {} bytes em {:.0f} segundos'.format(
+                            transfer.name, transfer.total - total, now - start))
+                    self.unwatch(transfer)
+                    transfer.abort()
+                    if self.metrics:
+                        self.metrics.increment('download_stalls_total', file=transfer.name)
+
+
 class File_utils:
-    def __init__(self, log):
+    DURABILITY_NONE = 'none'
+    DURABILITY_CLOSE = 'close'
+
+    # Tamanho máximo de cada leitura da rede; os blocos gravados em disco continuam com chunk_size
+    READ_SIZE = 64*1024
+
+    def __init__(self, log, http=None, chunk_size=1024*1024, durability=DURABILITY_CLOSE,
+                 checksum='sha256', verify_zip=True, min_rate=1024, stall_window=300, stall_retries=3, metrics=None):
+        """
+            Args:
+                log (object): instância do log a registrar mensagens de error, debug e warning
+                http (Http_session): sessão HTTP usada nos downloads; se nula, usa a sessão padrão compartilhada
+                chunk_size (int): tamanho, em bytes, dos blocos lidos da rede e gravados em disco
+                durability (str ou float): quando os dados são forçados para o disco (fsync):
+                               ** 'none': nunca, fica a cargo do sistema operacional
+                               ** 'close': uma única vez, ao final do download
+                               ** número N: a cada N MB gravados e ao final do download
+                checksum (str): algoritmo de hash (hashlib) calculado durante o download e gravado em
+                    '<filename>.<algoritmo>'; None para não calcular
+                verify_zip (boolean): True para conferir o diretório central dos arquivos .zip antes de
+                    considerar o download concluído
+                min_rate (float): vazão mínima, em bytes por segundo, medida em janelas de stall_window segundos.
+                    Um download mais lento é considerado travado. Ver Stall_watchdog.
+                stall_window (float): janela, em segundos, em que a vazão é medida
+                stall_retries (int): quantidade de vezes que um download travado ou com a conexão interrompida
+                    é retomado antes de desistir
+                metrics (Metrics): coleta latência, bytes, vazão, tempo de disco e novas tentativas de cada download;
+                    None para desativar
+        """
+        if durability not in (self.DURABILITY_NONE, self.DURABILITY_CLOSE) and \
+                (isinstance(durability, str) or durability <= 0):
+            raise ValueError('Durabilidade inválida: {}'.format(durability))
         self.log = log
-        
-    def download_file_from_url(self, url, params, filename):
+        self.http = http or Http_session.default()
+        self.chunk_size = chunk_size
+        self.durability = durability
+        self.checksum = checksum
+        self.verify_zip = verify_zip
+        self.stall_retries = stall_retries
+        self.metrics = metrics
+        self.watchdog = Stall_watchdog(min_rate, stall_window, log=log, metrics=metrics)
+        self.progress = None
+
+    def download_file_from_url(self, url, params, filename, headers=None):
+        """
+        Salva o arquivo no local desejado. 
+        Downloads travados (ver Stall_watchdog) ou com a conexão interrompida são retomados
+        a partir do arquivo temporário até stall_retries vezes.
+        Ver __download_file.
+        Exception:
+            ValueError caso a sessão seja uma Replay_session: os downloads não são arquivados por
+            Recording_session e, portanto, não podem ser reproduzidos
+        """
+        if isinstance(self.http, Replay_session):
+            raise ValueError('Downloads não podem ser reproduzidos de um Page_archive (Replay_session): '
+                             '{} não foi arquivado; use uma sessão HTTP para baixar os arquivos'.format(filename))
+        for attempt in range(self.stall_retries + 1):
+            try:
+                return self.__download_file(url, params, filename, headers)
+            except (Stall_error, requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                if self.metrics:
+                    self.metrics.increment('download_retries_total', labels={'reason': type(e).__name__}, file=filename)
+                if attempt >= self.stall_retries:
+                    raise
+                if self.log:
+                    self.log.warning('Download de {} interrompido ({}), retomando: tentativa {} de {}'.format(
+                        filename, e, attempt + 1, self.stall_retries))
+
+    def __download_file(self, url, params, filename, headers=None):
         """
         Salva o arquivo no local desejado. 
         Printa o progresso de download do arquivo sendo cada '=' uma representação de 2% do arquivo salvo.
+        O download é feito em um arquivo temporário '<filename>.part', renomeado para filename apenas quando
+        o tamanho baixado confere com o informado pelo servidor. Caso o arquivo temporário já exista
+        (download interrompido) e o servidor aceite requisições Range, apenas os bytes restantes são baixados.
+        A requisição Range vai acompanhada de If-Range com o validador (ETag ou Last-Modified) da resposta
+        que iniciou o arquivo temporário, gravado em '<filename>.part.validator': se o arquivo remoto mudou,
+        o servidor responde 200 com o arquivo completo e o download recomeça do zero, em vez de emendar
+        bytes de versões diferentes. Sem validador, o download também recomeça do zero.
+        O hash do arquivo é calculado durante o download e gravado ao lado do arquivo (ver finish_download).
         Args:
             url (string): portal de download. Ex.: 'http://arquivos.portaldatransparencia.gov.br/downloads.asp'
             params (json): parametros a serem passados para a url. Devem ser passados:
@@ -38,58 +298,287 @@ class File_utils:
                                ** mes desejado com 2 caracteres
                                ** base de dados a ser consultada. Ex: 'c: BolsaFamiliaFolhaPagamento'
             filename (string): nome do arquivo a ser salvo
+            headers (dict): cabeçalhos adicionais, como If-None-Match/If-Modified-Since para uma requisição condicional
+        Returns:
+            Dicionário com etag, last_modified, size e checksum do arquivo baixado;
+            None caso o servidor responda 304 (arquivo não modificado)
         Exception:
-            Lanca excecao em caso de algum erro
+            Lanca excecao em caso de algum erro; Stall_error caso o download trave
         """
         url = url.strip()
+        part_filename = filename + '.part'
 
         # Checa a existencia da pasta de destino do arquivo
         folder = os.path.dirname(filename)
-        if not os.path.exists(folder):
-            os.makedirs(folder)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
             os.chmod(folder, stat.S_IRWXU)
 
         # Requisicao para obter o tamanho do arquivo a ser baixado
         if self.log:
             self.log.debug('URL do arquivo a ser baixado: ' + url)
-            
-        r = requests.get(url, stream=True, params=params)
+
+        # Arquivos zip não se beneficiam de compressão e o tamanho precisa corresponder ao content-length
+        request_headers = dict(headers or {})
+        request_headers['Accept-Encoding'] = 'identity'
+        offset = os.path.getsize(part_filename) if os.path.isfile(part_filename) else 0
+        validator = self.read_validator(part_filename) if offset else None
+        if offset and validator:
+            request_headers['Range'] = 'bytes={}-'.format(offset)
+            request_headers['If-Range'] = validator
+        elif offset:
+            if self.log:
+                self.log.warning('Arquivo temporário de {} sem validador, recomeçando o download'.format(filename))
+            offset = 0
+
+        request_start = time.perf_counter()
+        r = self.http.get(url, stream=True, params=params, headers=request_headers)
+        if self.metrics:
+            self.metrics.observe('download_request_seconds', time.perf_counter() - request_start,
+                                 {'status': str(r.status_code)}, file=filename)
         if r is None:
             raise ValueError('Nenhuma resposta do site {} para o arquivo {}'.format(url, filename))
 
-        total_length = r.headers.get('content-length')
-        if total_length is None:
-            total_length = 0
-        total_length = int(total_length)
-        load = 0
+        if r.status_code == 304: # arquivo não modificado desde o último download
+            r.close()
+            if self.log:
+                self.log.debug('Arquivo {} não modificado'.format(filename))
+            return None
+        if r.status_code == 416: # o arquivo temporário já está completo ou é maior que o arquivo remoto
+            r.close()
+            if offset and offset == self.get_range_total(r.headers.get('content-range')):
+                result = self.finish_download(part_filename, filename, r, offset)
+                if not (result['etag'] or result['last_modified']):
+                    # a resposta 416 costuma vir sem validadores; o do arquivo temporário descreve o mesmo conteúdo
+                    result['last_modified' if parsedate(validator) else 'etag'] = validator
+                return result
+            self.remove_part(part_filename)
+            return self.download_file_from_url(url, params, filename, headers)
+        r.raise_for_status()
+
+        if r.status_code == 206: # continua de onde parou
+            mode = 'ab'
+            load = offset
+            total_length = self.get_range_total(r.headers.get('content-range'))
+        else: # servidor ignorou o Range ou o arquivo mudou (If-Range), recomeça do zero
+            if offset and self.log:
+                self.log.warning('Servidor respondeu {} ao Range de {}, recomeçando o download'.format(r.status_code, filename))
+            mode = 'wb'
+            load = 0
+            total_length = int(r.headers.get('content-length') or 0)
+            self.write_validator(part_filename, r)
+
         if self.log:
             self.log.warning('Downloading {} [{}]:\n\turl {}\n\tparâmetros {}'.format(filename, 
                                                                                  self.get_readable_size(int(total_length)),
                                                                                  url,
                                                                                  params))
+            if load:
+                self.log.warning('Retomando o download de {} a partir de {}'.format(filename, self.get_readable_size(load)))
 
-        # Download em si
-        with open(filename, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192*4):
-                if not chunk:
-                    log.debug('chunk nulo')
-                    continue
+        fsync_bytes = None
+        if self.durability not in (self.DURABILITY_NONE, self.DURABILITY_CLOSE):
+            fsync_bytes = int(self.durability * 1024 * 1024)
+        unsynced = 0
+
+        # O hash de um download retomado inclui os bytes já presentes no arquivo temporário
+        digest = self.hash_file(part_filename) if mode == 'ab' else self.new_digest()
+
+        # Download em si; o tempo de disco só é medido com métricas
+        timed = self.metrics is not None
+        disk_time = 0
+        start_load = load
+        transfer = self.watchdog.watch(filename, r)
+        try:
+            with open(part_filename, mode, buffering=max(self.chunk_size, io.DEFAULT_BUFFER_SIZE)) as f:
+                for chunk in r.iter_content(chunk_size=min(self.chunk_size, self.READ_SIZE)):
+                    if not chunk:
+                        if self.log:
+                            self.log.debug('chunk nulo')
+                        continue
 
-                f.write(chunk)
-                f.flush()
-                os.fsync(f.fileno())
+                    if timed:
+                        write_start = time.perf_counter()
+                    f.write(chunk)
+                    if fsync_bytes:
+                        unsynced += len(chunk)
+                        if unsynced >= fsync_bytes:
+                            f.flush()
+                            os.fsync(f.fileno())
+                            unsynced = 0
+                    if timed:
+                        disk_time += time.perf_counter() - write_start
+                    if digest:
+                        digest.update(chunk)
 
-                # printa o status (tamanho) de download realizado
-                load += len(chunk)
-                self.check_progress(load, total_length)
+                    # printa o status (tamanho) de download realizado
+                    load += len(chunk)
+                    transfer.total += len(chunk)
+                    self.report_progress(filename, load, total_length)
+
+                if timed:
+                    write_start = time.perf_counter()
+                if self.durability != self.DURABILITY_NONE:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if timed:
+                disk_time += time.perf_counter() - write_start
+        except Exception as e:
+            if transfer.stalled:
+                raise Stall_error('Download de {} travado: vazão abaixo de {}/s'.format(
+                    filename, self.get_readable_size(self.watchdog.min_rate))) from e
+            raise
+        finally:
+            self.watchdog.unwatch(transfer)
+            r.close()
+            if timed: # inclui as tentativas interrompidas
+                elapsed = time.perf_counter() - request_start
+                self.metrics.observe('download_seconds', elapsed, file=filename)
+                self.metrics.observe('download_bytes', load - start_load, file=filename)
+                self.metrics.observe('download_bytes_per_second', (load - start_load) / elapsed if elapsed else 0, file=filename)
+                self.metrics.observe('download_disk_seconds', disk_time, file=filename)
+            if self.progress:
+                self.progress.finish(filename)
+            else:
+                print('\n')
+
+        if transfer.stalled: # a conexão foi fechada sem que a leitura acusasse erro
+            raise Stall_error('Download de {} travado: vazão abaixo de {}/s'.format(
+                filename, self.get_readable_size(self.watchdog.min_rate)))
+        if total_length and load != total_length:
+            raise IOError('Download incompleto de {}: {} de {} bytes'.format(filename, load, total_length))
+        return self.finish_download(part_filename, filename, r, load, digest)
+
+    @staticmethod
+    def read_validator(part_filename):
+        """ Validador (If-Range) da resposta que iniciou o arquivo temporário, ou None caso não haja """
+        try:
+            with open(part_filename + '.validator', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    @staticmethod
+    def write_validator(part_filename, r):
+        """
+            Registra o validador da resposta que inicia o arquivo temporário: o ETag forte ou, na falta dele,
+            o Last-Modified (ETags fracos não são aceitos em If-Range). Sem validador, remove o registro anterior.
+        """
+        etag = r.headers.get('etag')
+        validator = etag if etag and not etag.startswith('W/') else r.headers.get('last-modified')
+        if validator:
+            with open(part_filename + '.validator', 'w', encoding='utf-8') as f:
+                f.write(validator)
+        elif os.path.isfile(part_filename + '.validator'):
+            os.remove(part_filename + '.validator')
+
+    @staticmethod
+    def remove_part(part_filename):
+        """ Remove o arquivo temporário e o seu validador """
+        for name in (part_filename, part_filename + '.validator'):
+            if os.path.isfile(name):
+                os.remove(name)
+
+    def new_digest(self):
+        """ Retorna um novo objeto hashlib do algoritmo configurado, ou None caso o checksum esteja desativado """
+        return hashlib.new(self.checksum) if self.checksum else None
+
+    def hash_file(self, filename):
+        """ Calcula o hash de um arquivo já existente em disco """
+        digest = self.new_digest()
+        if digest:
+            with open(filename, 'rb') as f:
+                for block in iter(lambda: f.read(self.chunk_size), b''):
+                    digest.update(block)
+        return digest
+
+    def finish_download(self, part_filename, filename, r, size, digest=None):
+        """
+            Confere a integridade do arquivo temporário e o renomeia para o nome final.
+            O checksum é gravado em '<filename>.<algoritmo>', no formato do sha256sum,
+            para que o arquivo possa ser conferido sem ser lido novamente. O arquivo do checksum é publicado
+            antes do arquivo baixado: quem encontra o arquivo final sempre encontra também o seu checksum.
+            Args:
+                part_filename (str): arquivo temporário baixado
+                filename (str): nome final do arquivo
+                r (requests.Response): resposta do servidor
+                size (int): tamanho do arquivo em bytes
+                digest (object): hash calculado durante o download; se nulo, é calculado a partir do arquivo
+            Returns:
+                Dicionário com os validadores HTTP da resposta, o tamanho e o checksum do arquivo baixado
+            Exception:
+                IOError caso o arquivo .zip esteja corrompido
+        """
+        if self.verify_zip and filename.lower().endswith('.zip'):
+            try:
+                with zipfile.ZipFile(part_filename) as z:
+                    z.infolist()
+            except zipfile.BadZipFile as e:
+                # Se o tamanho era conhecido, o arquivo está completo e corrompido; não adianta retomar
+                if self.get_range_total(r.headers.get('content-range')) or r.headers.get('content-length'):
+                    self.remove_part(part_filename)
+                raise IOError('Arquivo zip inválido {}: {}'.format(filename, e))
+
+        if digest is None:
+            digest = self.hash_file(part_filename)
+        checksum = digest.hexdigest() if digest else None
+
+        if checksum:
+            checksum_filename = '{}.{}'.format(filename, self.checksum)
+            with open(checksum_filename + '.part', 'w') as f:
+                f.write('{}  {}\n'.format(checksum, os.path.basename(filename)))
+                if self.durability != self.DURABILITY_NONE:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(checksum_filename + '.part', checksum_filename)
+        os.replace(part_filename, filename)
+        if os.path.isfile(part_filename + '.validator'):
+            os.remove(part_filename + '.validator')
+        if self.durability != self.DURABILITY_NONE:
+            self.fsync_folder(os.path.dirname(filename))
+
+        return {'etag': r.headers.get('etag'),
+                'last_modified': r.headers.get('last-modified'),
+                'size': size,
+                'checksum': checksum}
+
+    @staticmethod
+    def fsync_folder(folder):
+        """ Garante que a renomeação do arquivo foi gravada em disco. Não tem efeito em sistemas sem suporte. """
+        try:
+            fd = os.open(folder or '.', os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
 
-                # Set the signal handler and a 5-second alarm
-                signal.signal(signal.SIGALRM, self.handler)
-                signal.alarm(300)
+    @staticmethod
+    def get_range_total(content_range):
+        """
+            Extrai o tamanho total do arquivo do cabeçalho Content-Range.
+            Args:
+                content_range (str): valor do cabeçalho. Ex.: 'bytes 100-199/1000' ou 'bytes */1000'
+            Returns:
+                Tamanho total em bytes; 0 caso seja desconhecido
+        """
+        if not content_range:
+            return 0
+        total = content_range.rsplit('/', 1)[-1].strip()
+        return int(total) if total.isdigit() else 0
 
-        # Desativa o alarme
-        signal.alarm(0)
-        print('\n')
+    def report_progress(self, filename, complete, total):
+        """
+            Repassa o progresso do download para o acompanhamento configurado em self.progress
+            ou, caso não haja nenhum, para a barra de progresso de check_progress.
+        """
+        if self.progress:
+            self.progress.update(filename, complete, total)
+        else:
+            self.check_progress(complete, total)
         
     @staticmethod
     def get_readable_size(size, precision=2):
@@ -125,10 +614,6 @@ class File_utils:
         done = int(50 * complete / total)
         sys.stdout.write("\r[%s%s]" % ('=' * done, ' ' * (50-done)) )
         sys.stdout.flush()
-     
-    @staticmethod
-    def handler(signum, frame):
-        raise IOError('Processo travado {}'.format(signum))
 
 
 class Transparencia_Scraper(Html_utils, File_utils):
@@ -136,10 +621,42 @@ class Transparencia_Scraper(Html_utils, File_utils):
         Classe para download dos arquivos relativos as bases disponibilizados pelo Governo Federal
         no site transparência.
     """
-    def __init__(self, log=None):
-        File_utils.__init__(self, log)
-        self.url_main = 'http://portaldatransparencia.gov.br/downloads/'
-        self.url_download = 'http://arquivos.portaldatransparencia.gov.br/downloads.asp'
+    def __init__(self, log=None, http=None, chunk_size=1024*1024, durability=File_utils.DURABILITY_CLOSE,
+                 manifest=None, checksum='sha256', verify_zip=True, ingestor=None, catalog=None,
+                 min_rate=1024, stall_window=300, stall_retries=3, metrics=None,
+                 url_main='http://portaldatransparencia.gov.br/downloads/',
+                 url_download='http://arquivos.portaldatransparencia.gov.br/downloads.asp'):
+        """
+            Args:
+                log (object): instância do log a registrar mensagens de error, debug e warning
+                http (Http_session): sessão HTTP compartilhada entre as páginas e os downloads
+                chunk_size (int): tamanho, em bytes, dos blocos gravados em disco
+                durability (str ou float): 'none', 'close' ou N para fsync a cada N MB. Ver File_utils.
+                checksum (str): algoritmo de hash calculado durante o download; None para não calcular
+                verify_zip (boolean): True para conferir a integridade dos arquivos .zip baixados
+                manifest (Download_manifest ou str): manifesto dos arquivos baixados, ou o caminho do seu arquivo SQLite.
+                    Quando informado, arquivos já baixados são revalidados com requisições condicionais
+                    e baixados novamente apenas se tiverem sido alterados no servidor.
+                ingestor (Parquet_ingestor): etapa opcional que converte cada zip baixado em Parquet particionado
+                catalog (Schema_catalog ou str): snapshot do catálogo de bases, ou o caminho do seu arquivo JSON.
+                    Quando informado, a descoberta das bases só é refeita depois que o snapshot expira.
+                min_rate, stall_window, stall_retries: detecção e retomada de downloads travados. Ver File_utils.
+                metrics (Metrics): métricas de desempenho das páginas e dos downloads; None para desativar
+                url_main (str): página com a lista de bases para download
+                url_download (str): endereço de download dos arquivos
+        """
+        Html_utils.__init__(self, http, metrics)
+        File_utils.__init__(self, log, self.http, chunk_size, durability, checksum, verify_zip,
+                            min_rate, stall_window, stall_retries, metrics)
+        if isinstance(manifest, str):
+            manifest = Download_manifest(manifest)
+        self.manifest = manifest
+        self.ingestor = ingestor
+        if isinstance(catalog, str):
+            catalog = Schema_catalog(catalog)
+        self.catalog = catalog
+        self.url_main = url_main
+        self.url_download = url_download
             
     def __print_error_msg(self, msg):
         if self.log:
@@ -174,7 +691,7 @@ class Transparencia_Scraper(Html_utils, File_utils):
         c = None
         
         if os.path.splitext(url)[1] != '.zip':
-            content = requests.get(url).text
+            content = self.fetch(url).text
 
         if 'c' in params:
             c = params['c'][0]
@@ -203,7 +720,7 @@ class Transparencia_Scraper(Html_utils, File_utils):
             return True
         return False
         
-    def process_file(self, c, params, zip_filename, url_file):
+    def process_file(self, c, params, zip_filename, url_file, status=None):
         """
             Baixa o arquivo localmente para a pasta cujo nome é o mesmo da base ao qual o
             arquivo pertence
@@ -212,14 +729,56 @@ class Transparencia_Scraper(Html_utils, File_utils):
                 params (dict): Dicionário com os parâmetros necessários para a identificação do arquivo a ser baixado
                 zip_filename (str): nome final que o arquivo a ser salvo deverá assumir
                 url_file (str): endereço da url de download dos arquivos
+                status (str): status atribuído por plan; 'changed' força a revalidação de um arquivo já baixado,
+                    mesmo sem manifesto
             Returns:
                 True caso o arquivo tenha sido baixado localmente e False caso contrário
         """
-        if self.check_downloaded_file(zip_filename, params):
+        downloaded = self.check_downloaded_file(zip_filename, params)
+        if self.manifest is None and status != 'changed':
+            if downloaded:
+                return False
+            self.download_file_from_url(url_file, params, zip_filename)
+            return True
+
+        # Com manifesto, ou quando plan o marcou como alterado, o arquivo já baixado é revalidado com uma requisição condicional
+        headers = None
+        if downloaded:
+            headers = self.get_conditional_headers(zip_filename)
+        info = self.download_file_from_url(url_file, params, zip_filename, headers)
+        if info is None:
+            if self.manifest:
+                self.manifest.touch(zip_filename)
             return False
-        self.download_file_from_url(url_file, params, zip_filename)
+        if self.manifest:
+            self.manifest.update(zip_filename, c, params, info)
         return True
     
+    def get_conditional_headers(self, zip_filename):
+        """ Cabeçalhos de requisição condicional de um arquivo já baixado: validadores do manifesto ou a data do arquivo local """
+        headers = self.manifest.conditional_headers(zip_filename) if self.manifest else None
+        if not headers:
+            headers = {'If-Modified-Since': formatdate(os.path.getmtime(zip_filename), usegmt=True)}
+        return headers
+
+    def is_changed(self, params, zip_filename, url_file):
+        """
+            Verifica, sem baixar o conteúdo, se um arquivo já baixado foi alterado no servidor:
+            faz a requisição condicional e fecha a conexão assim que os cabeçalhos são recebidos.
+            Returns:
+                False caso o servidor responda 304 (não modificado), True caso responda 200
+            Exception:
+                requests.HTTPError ou IOError para qualquer outra resposta (ex.: 404, 429, 500)
+        """
+        r = self.http.get(url_file.strip(), params=params, headers=self.get_conditional_headers(zip_filename), stream=True)
+        r.close()
+        if r.status_code == 304:
+            return False
+        r.raise_for_status()
+        if r.status_code != 200:
+            raise IOError('Resposta inesperada HTTP {} ao revalidar {}'.format(r.status_code, zip_filename))
+        return True
+
     def __get_file_info(self, c, file_param):
         original_c = c
         params = {'a': file_param[0], 'consulta': c}
@@ -241,19 +800,89 @@ class Transparencia_Scraper(Html_utils, File_utils):
 
         return params, zip_filename
         
-    def process_schemas(self, process_copa=False):
+    def __iter_files(self, process_copa=False):
         """
-            A url inicial mostra as bases disponíveis para download.
-            Cada base possui uma URL que é um link para uma página que possui os arquivos disponíveis e deve ser 'crawleada'
-            Algumas bases são enviadas através do parâmetro c=NOME_DA_BASE, outras são enviadas como consulta=NOME_DA_BASE
-            Exs de links: 
-                * snapshot.asp?c=Convenios
-                * mensal.asp?c=OutrasTransferenciasCidadao
-                * imoveisFuncionais.asp
-                * http://arquivos.portaldatransparencia.gov.br/downloads.asp?a=2015&amp;m=04&amp;consulta=Copa
+            Gera a lista de arquivos a serem baixados, a partir do snapshot do catálogo quando houver
+            um válido ou percorrendo as bases disponíveis no portal.
             Args:
-                process_copa (boolean): True caso se deseje que processe os arquivos da Copa. 
-                    Default False uma vez que os dados não são atualizados e devem ser processados apenas uma única vez.
+                process_copa (boolean): True caso se deseje que processe os arquivos da Copa.
+            Returns:
+                Gerador de tuplas (nome da base, parâmetros, nome do arquivo zip, url de download)
+        """
+        if self.catalog is None:
+            yield from self.__discover_files(process_copa)
+            return
+        for file_info in self.get_catalog():
+            if process_copa or file_info[0] != 'Copa':
+                yield file_info
+
+    def get_catalog(self, refresh=False):
+        """
+            Retorna o catálogo de arquivos disponíveis, incluindo os da Copa.
+            Usa o snapshot caso ele ainda seja válido; caso contrário, percorre as bases do portal,
+            grava o novo snapshot e registra as diferenças em relação ao anterior.
+            Args:
+                refresh (boolean): True para ignorar o snapshot e refazer a descoberta
+            Returns:
+                lista de tuplas (nome da base, parâmetros, nome do arquivo zip, url de download)
+        """
+        files = None if refresh or self.catalog is None else self.catalog.load()
+        if files is not None:
+            if self.log:
+                self.log.warning('Catálogo carregado de {} com {} arquivos'.format(self.catalog.path, len(files)))
+            return files
+
+        files = list(self.__discover_files(process_copa=True))
+        if self.catalog is not None:
+            added, removed = self.catalog.save(files)
+            if self.log:
+                self.log.warning('Catálogo atualizado: {} arquivos, {} novos, {} removidos'.format(len(files), len(added), len(removed)))
+                for filename in removed:
+                    self.log.warning('Arquivo removido do portal: {}'.format(filename))
+        return files
+
+    def plan(self, process_copa=False, refresh=False, revalidate=False):
+        """
+            Lista, sem baixar nenhum arquivo, os arquivos que process_schemas baixaria.
+            O resultado pode ser repassado, inteiro ou em partes, para process_schemas(files=...).
+            Args:
+                process_copa (boolean): True caso se deseje incluir os arquivos da Copa
+                refresh (boolean): True para ignorar o snapshot do catálogo e refazer a descoberta
+                revalidate (boolean): True para verificar com requisições condicionais (apenas cabeçalhos)
+                    se os arquivos já baixados foram alterados no servidor
+            Returns:
+                lista de dicionários {'base', 'params', 'filename', 'url', 'status'}, com status
+                'new' para arquivos ainda não baixados e 'changed' para os alterados no servidor.
+                Arquivos cuja revalidação falha são registrados no log e omitidos.
+        """
+        planned = []
+        files = [f for f in self.get_catalog(refresh) if process_copa or f[0] != 'Copa']
+        for schema_name, params, zip_filename, url_file in files:
+            if not self.check_downloaded_file(zip_filename, params):
+                status = 'new'
+            elif not revalidate:
+                continue
+            else:
+                try:
+                    if not self.is_changed(params, zip_filename, url_file):
+                        continue
+                except Exception as e:
+                    self.__print_error_msg('Erro ao revalidar o arquivo {}: {}'.format(zip_filename, e))
+                    continue
+                status = 'changed'
+            planned.append({'base': schema_name, 'params': params, 'filename': zip_filename,
+                            'url': url_file, 'status': status})
+        if self.log:
+            self.log.warning('{} arquivos a baixar de {} no catálogo'.format(len(planned), len(files)))
+        return planned
+
+    def __discover_files(self, process_copa=False):
+        """
+            Percorre as bases disponíveis no portal e gera a lista de arquivos a serem baixados.
+            Args:
+                process_copa (boolean): True caso se deseje que processe os arquivos da Copa.
+            Returns:
+                Gerador de tuplas (nome da base, parâmetros, nome do arquivo zip, url de download)
         """
         for l in self.__get_links():
             schema_url = (self.url_main + l['href'])
@@ -273,10 +902,7 @@ class Transparencia_Scraper(Html_utils, File_utils):
                 
 
             if schema_name == 'Copa':
-                self.process_file(schema_name, 
-                                  params=None, 
-                                  zip_filename=schema_name+'/'+schema_name+'.zip', 
-                                  url_file=l['href'])
+                yield schema_name, None, schema_name+'/'+schema_name+'.zip', l['href']
 
             else:
                 scrap_pattern = r'{"ano":"([0-9]{4})","mes":"([0-9]{2}|_F)"(,"dia":"([0-9]*)")?(,"tipo":"?(\w*)")?(,"origem":"?(\w*)")?}'
@@ -286,8 +912,133 @@ class Transparencia_Scraper(Html_utils, File_utils):
 
                 for f in files_params:
                     params, zip_filename = self.__get_file_info(schema_name, f)
-                    res = self.process_file(schema_name, params, zip_filename, self.url_download)
-                
-            folder = os.path.dirname(zip_filename)
+                    yield schema_name, params, zip_filename, self.url_download
+
+    def __process_file_safe(self, file_info, host_limiter=None):
+        """
+            Executa process_file capturando o erro, para que a falha de um arquivo não interrompa os demais.
+            Args:
+                file_info (tuple): tupla gerada por __iter_files, opcionalmente seguida do status atribuído por plan
+                host_limiter (Host_limiter): limita os downloads simultâneos em um mesmo servidor
+            Returns:
+                None em caso de sucesso ou a exceção lançada pelo download
+        """
+        schema_name, params, zip_filename, url_file = file_info[:4]
+        status = file_info[4] if len(file_info) > 4 else None
+        semaphore = host_limiter.get(url_file) if host_limiter else None
+        try:
+            if semaphore:
+                with semaphore:
+                    downloaded = self.process_file(schema_name, params, zip_filename, url_file, status)
+            else:
+                downloaded = self.process_file(schema_name, params, zip_filename, url_file, status)
+        except Exception as e:
+            self.__print_error_msg('Erro ao baixar o arquivo {}: {}'.format(zip_filename, e))
+            return e
+        if downloaded and self.ingestor:
+            self.ingestor.submit(params, zip_filename)
+        return None
+
+    def process_schemas(self, process_copa=False, workers=1, per_host_limit=None, files=None):
+        """
+            A url inicial mostra as bases disponíveis para download.
+            Cada base possui uma URL que é um link para uma página que possui os arquivos disponíveis e deve ser 'crawleada'
+            Algumas bases são enviadas através do parâmetro c=NOME_DA_BASE, outras são enviadas como consulta=NOME_DA_BASE
+            Exs de links: 
+                * snapshot.asp?c=Convenios
+                * mensal.asp?c=OutrasTransferenciasCidadao
+                * imoveisFuncionais.asp
+                * http://arquivos.portaldatransparencia.gov.br/downloads.asp?a=2015&amp;m=04&amp;consulta=Copa
+            Args:
+                process_copa (boolean): True caso se deseje que processe os arquivos da Copa. 
+                    Default False uma vez que os dados não são atualizados e devem ser processados apenas uma única vez.
+                workers (int): quantidade de downloads simultâneos. Default 1, ou seja, um arquivo por vez.
+                per_host_limit (int): quantidade máxima de downloads simultâneos em um mesmo servidor.
+                    Default None, limitado apenas por workers.
+                files (list): arquivos a processar, no formato retornado por plan. Default None, todos os arquivos do catálogo.
+            Returns:
+                Dicionário {nome do arquivo: exceção} com os arquivos cujo download ou conversão falhou
+        """
+        errors = {}
+        folders = set()
+        if files is None:
+            files = self.__iter_files(process_copa)
+        else:
+            files = [(f['base'], f['params'], f['filename'], f['url'], f.get('status')) for f in files]
+
+        if workers <= 1:
+            for file_info in files:
+                folders.add(os.path.dirname(file_info[2]))
+                error = self.__process_file_safe(file_info)
+                if error:
+                    errors[file_info[2]] = error
+        else:
+            host_limiter = Host_limiter(per_host_limit) if per_host_limit else None
+            self.progress = Download_progress(self.log)
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = {}
+                    for file_info in files:
+                        folders.add(os.path.dirname(file_info[2]))
+                        futures[executor.submit(self.__process_file_safe, file_info, host_limiter)] = file_info[2]
+                    for future in as_completed(futures):
+                        error = future.result()
+                        if error:
+                            errors[futures[future]] = error
+            finally:
+                self.progress = None
+
+        if self.ingestor:
+            errors.update(self.ingestor.wait())
+
+        for folder in folders:
             if os.path.exists(folder) and not os.listdir(folder):
                 os.rmdir(folder)
+        if errors:
+            self.__print_error_msg('{} arquivos com erro: {}'.format(len(errors), ', '.join(sorted(errors))))
+        return errors
+
+    def enqueue_files(self, work_queue, files=None, process_copa=False):
+        """
+            Enfileira os arquivos a baixar em uma fila de trabalho compartilhada, para que sejam
+            processados por process_queue em uma ou mais máquinas.
+            Args:
+                work_queue (Work_queue): fila compartilhada
+                files (list): arquivos no formato retornado por plan. Default None, o resultado de plan(process_copa).
+                process_copa (boolean): True caso se deseje incluir os arquivos da Copa
+            Returns:
+                quantidade de arquivos enfileirados. Arquivos pendentes na fila são ignorados; arquivos já
+                concluídos ou falhos voltam à fila, pois plan os lista apenas quando são novos ou foram alterados.
+        """
+        if files is None:
+            files = self.plan(process_copa)
+        added = work_queue.put_many('file', [(f['filename'], f) for f in files], requeue=True)
+        if self.log:
+            self.log.warning('{} arquivos enfileirados'.format(added))
+        return added
+
+    def __process_queued_file(self, f, worker):
+        if self.process_file(f['base'], f['params'], f['filename'], f['url'], f.get('status')) and self.ingestor:
+            self.ingestor.submit(f['params'], f['filename'])
+
+    def process_queue(self, work_queue, worker=None, workers=1, lease_time=60*60, retries=3):
+        """
+            Baixa os arquivos enfileirados por enqueue_files até que a fila se esgote.
+            Vários processos, em uma ou mais máquinas, podem consumir a mesma fila sem repetir arquivos.
+            Args:
+                work_queue (Work_queue): fila compartilhada
+                worker (str): identificador deste worker; default '<máquina>-<pid>'
+                workers (int): quantidade de downloads simultâneos neste worker
+                lease_time (float): prazo, em segundos, para concluir cada download antes que o arquivo
+                    seja entregue a outro worker. Deve superar o download mais demorado.
+                retries (int): quantidade de novas tentativas de cada arquivo
+            Returns:
+                Dicionário {nome do arquivo: erro} com os arquivos cujo download ou conversão falhou
+        """
+        errors = Queue_worker(work_queue, 'file', self.__process_queued_file, worker, workers,
+                              lease_time, retries, log=self.log, metrics=self.metrics).run()
+        if self.ingestor:
+            errors.update(self.ingestor.wait())
+        if errors:
+            self.__print_error_msg('{} arquivos com erro: {}'.format(len(errors), ', '.join(sorted(errors))))
+        return errors
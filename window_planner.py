@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import math
+import pandas as pd
+
+
+def window_key(date_in, date_out):
+    """
+        Identifica uma janela de consulta: 'YYYYMM' para um mês completo, como nas versões anteriores,
+        ou 'YYYYMMDD-YYYYMMDD' para as demais janelas.
+        Os 4 primeiros caracteres são sempre o ano; o restante faz o papel do mês nos nomes dos CSVs e no checkpoint.
+    """
+    date_in, date_out = pd.Timestamp(date_in), pd.Timestamp(date_out)
+    if date_in.day == 1 and date_out.normalize() == (date_in + pd.offsets.MonthEnd(0)).normalize():
+        return date_in.strftime('%Y%m')
+    return '{}-{}'.format(date_in.strftime('%Y%m%d'), date_out.strftime('%Y%m%d'))
+
+
+def parse_window_key(key):
+    """
+        Returns:
+            (data inicial, data final) da janela identificada por window_key
+    """
+    if len(key) == 6:
+        date_in = pd.Timestamp(key[:4] + '-' + key[4:] + '-01')
+        return date_in, date_in + pd.offsets.MonthEnd(0)
+    date_in, date_out = key.split('-')
+    return pd.Timestamp(date_in), pd.Timestamp(date_out)
+
+
+class Window_planner:
+    """
+        Escolhe as janelas de consulta (periodoInicio/periodoFim) de cada órgão a partir das quantidades de páginas
+        e de linhas já registradas no checkpoint para o órgão:
+            * meses consecutivos cujo total estimado cabe em merge_pages páginas são consultados em uma única janela:
+              cada mês vazio deixa de custar uma requisição (e a espera do controle de taxa), e as últimas páginas,
+              incompletas, de meses pequenos passam a ser compartilhadas;
+            * opcionalmente, meses com split_pages páginas ou mais são divididos em janelas de cerca de target_pages
+              páginas. Como cada página já é um item de trabalho independente, a divisão não acelera a consulta e custa
+              uma página incompleta a mais por janela; serve apenas para portais que limitam a profundidade da paginação;
+            * órgãos sem histórico continuam sendo consultados mês a mês, o que alimenta o histórico.
+        A estimativa de cada mês é a maior densidade (linhas por dia) observada nas janelas do órgão, de forma
+        conservadora: um único mês movimentado no histórico basta para que os meses do órgão não sejam agrupados.
+    """
+    def __init__(self, merge_pages=10, max_merge=12, split_pages=None, target_pages=10, page_size=15):
+        """
+            Args:
+                merge_pages (int): quantidade máxima de páginas estimadas de uma janela formada por vários meses
+                max_merge (int): quantidade máxima de meses em uma janela
+                split_pages (int): quantidade de páginas a partir da qual um mês é dividido; None para não dividir
+                target_pages (int): quantidade aproximada de páginas de cada janela de um mês dividido
+                page_size (int): linhas por página, usado enquanto o histórico não tiver uma página cheia
+        """
+        self.merge_pages = merge_pages
+        self.max_merge = max_merge
+        self.split_pages = split_pages
+        self.target_pages = target_pages
+        self.page_size = page_size
+
+    def get_page_size(self, history):
+        """ Linhas por página: a página 1 de uma janela com mais de uma página está cheia """
+        sizes = [rows for _, num_pages, rows, _ in history if num_pages and num_pages > 1 and rows]
+        return max(sizes) if sizes else self.page_size
+
+    def get_density(self, history):
+        """
+            Args:
+                history (list): tuplas (chave da janela, páginas, linhas da página 1, concluída) do checkpoint do órgão
+            Returns:
+                maior quantidade de linhas por dia observada nas janelas do órgão, ou None sem histórico
+        """
+        page_size = self.get_page_size(history)
+        density = None
+        for key, num_pages, rows, _ in history:
+            if not num_pages:
+                continue
+            date_in, date_out = parse_window_key(key)
+            window_rows = rows if num_pages == 1 and rows is not None else num_pages * page_size
+            density = max(density or 0, window_rows / float((date_out - date_in).days + 1))
+        return density
+
+    @staticmethod
+    def covered_windows(history, completed):
+        """ Janelas (data inicial, data final) do histórico concluídas (completed=True) ou em andamento (completed=False) """
+        return sorted(parse_window_key(key) for key, num_pages, _, done in history
+                      if num_pages and bool(done) == completed)
+
+    @staticmethod
+    def uncovered(date_in, date_out, windows):
+        """
+            Returns:
+                lista de tuplas (data inicial, data final) dos intervalos de dias consecutivos do período
+                que não pertencem a nenhuma das janelas
+        """
+        gaps = []
+        start = date_in
+        for window_in, window_out in sorted(windows):
+            if window_out < start or window_in > date_out:
+                continue
+            if window_in > start:
+                gaps.append((start, window_in - pd.Timedelta(days=1)))
+            start = max(start, window_out + pd.Timedelta(days=1))
+        if start <= date_out:
+            gaps.append((start, date_out))
+        return gaps
+
+    def plan(self, months, history, fixed=()):
+        """
+            Planeja as janelas de consulta de um órgão.
+            Args:
+                months (list): tuplas (primeiro dia, último dia) dos meses a consultar, em ordem
+                history (list): tuplas (chave da janela, páginas, linhas da página 1, concluída) do checkpoint do órgão
+                fixed (set): meses ('YYYYMM') que devem ser consultados mês a mês, como os meses em revisão
+            Returns:
+                lista de tuplas (data inicial, data final) das janelas. A cobertura é avaliada por dia: os dias já
+                cobertos por janelas concluídas são omitidos, janelas em andamento são mantidas e os dias restantes
+                de um mês parcialmente coberto (ex.: a segunda metade de um mês dividido) formam novas janelas,
+                para que nenhuma linha seja baixada duas vezes nem deixe de ser baixada.
+        """
+        density = self.get_density(history)
+        page_size = self.get_page_size(history)
+        done = self.covered_windows(history, True)
+        started = self.covered_windows(history, False)
+
+        windows = []
+        run = []
+        for month_in, month_out in months:
+            if month_in.strftime('%Y%m') in fixed:
+                windows.extend(self.__plan_run(run, density, page_size))
+                run = []
+                windows.append((month_in, month_out))
+                continue
+            overlapping = [w for w in started if w[0] <= month_out and w[1] >= month_in]
+            gaps = self.uncovered(month_in, month_out, done + overlapping)
+            if not overlapping and gaps == [(month_in, month_out)]: # mês ainda não consultado
+                run.append((month_in, month_out))
+                continue
+            windows.extend(self.__plan_run(run, density, page_size))
+            run = []
+            windows.extend(w for w in overlapping if w not in windows)
+            windows.extend(gaps)
+        windows.extend(self.__plan_run(run, density, page_size))
+        return windows
+
+    def __plan_run(self, run, density, page_size):
+        """ Agrupa ou divide uma sequência de meses consecutivos ainda não consultados """
+        if density is None:
+            return list(run)
+        windows = []
+        group = []
+        group_rows = 0
+        for month_in, month_out in run:
+            rows = density * ((month_out - month_in).days + 1)
+            if self.split_pages and rows >= self.split_pages * page_size:
+                if group:
+                    windows.append((group[0][0], group[-1][1]))
+                    group, group_rows = [], 0
+                windows.extend(self.split(month_in, month_out, int(math.ceil(rows / page_size / self.target_pages))))
+                continue
+            if group and (group_rows + rows > self.merge_pages * page_size or len(group) >= self.max_merge):
+                windows.append((group[0][0], group[-1][1]))
+                group, group_rows = [], 0
+            group.append((month_in, month_out))
+            group_rows += rows
+        if group:
+            windows.append((group[0][0], group[-1][1]))
+        return windows
+
+    @staticmethod
+    def split(date_in, date_out, parts):
+        """ Divide o período em 'parts' janelas de dias consecutivos, com no mínimo um dia cada """
+        days = (date_out - date_in).days + 1
+        parts = max(1, min(parts, days))
+        windows = []
+        start = date_in
+        for i in range(parts):
+            end = date_in + pd.Timedelta(days=(days * (i + 1)) // parts - 1)
+            windows.append((start, end))
+            start = end + pd.Timedelta(days=1)
+        return windows
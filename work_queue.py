@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Licensed under the MIT license:
+# http://www.opensource.org/licenses/mit-license
+# Copyright (c) 2017 Rede Globo
+
+__author__ = "Priscilla Lusie"
+__version__ = "1.0"
+
+import abc
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Work_queue(abc.ABC):
+    """
+        Interface de uma fila de trabalho compartilhada entre várias máquinas.
+        Os itens são entregues sob uma concessão (lease) com prazo: se o worker não concluir o item
+        até o fim do prazo, o item volta a ser entregue a outro worker.
+        Para usar um banco compartilhado, derive a classe e implemente os métodos abstratos abaixo.
+    """
+    @abc.abstractmethod
+    def put(self, kind, key, payload, requeue=False):
+        """
+            Enfileira um item; um item com o mesmo (kind, key) já existente é ignorado, exceto com requeue.
+            Args:
+                kind (str): tipo do item (ex.: 'file', 'diarias')
+                key (str): identificador único do item dentro do tipo
+                payload: dados do item, serializáveis em JSON
+                requeue (boolean): True para devolver à fila, com o novo payload e sem tentativas, um item
+                    já concluído ou falho, por exemplo um arquivo alterado ou um mês em revisão.
+                    Itens pendentes ou concedidos a um worker não são alterados.
+            Returns:
+                True caso o item tenha sido enfileirado
+        """
+        raise NotImplementedError
+
+    def put_many(self, kind, items, requeue=False):
+        """
+            Enfileira vários itens.
+            Args:
+                items (iterable): pares (key, payload)
+                requeue (boolean): como em put
+            Returns:
+                quantidade de itens enfileirados
+        """
+        return sum(self.put(kind, key, payload, requeue) for key, payload in items)
+
+    @abc.abstractmethod
+    def lease(self, kind, worker, duration, retries=3):
+        """
+            Concede ao worker o próximo item pendente, ou cuja concessão expirou.
+            Itens com concessão expirada que já esgotaram as tentativas são marcados como falhos.
+            Args:
+                kind (str): tipo do item
+                worker (str): identificador do worker
+                duration (float): prazo da concessão, em segundos
+                retries (int): quantidade de novas tentativas de um item
+            Returns:
+                dicionário {'id', 'kind', 'key', 'payload', 'attempts'} ou None caso não haja item disponível
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def complete(self, item_id, worker):
+        """
+            Conclui um item.
+            Returns:
+                False caso a concessão do worker tenha expirado e o item tenha sido entregue a outro worker
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def fail(self, item_id, worker, error, retries=3):
+        """
+            Registra a falha de um item, devolvendo-o à fila caso ainda haja tentativas.
+            Returns:
+                True caso o item tenha sido devolvido à fila
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def counts(self, kind):
+        """
+            Returns:
+                dicionário {situação: quantidade} dos itens do tipo
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def failures(self, kind):
+        """
+            Returns:
+                dicionário {key: erro} dos itens que falharam após todas as tentativas
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Sqlite_work_queue(Work_queue):
+    """
+        Fila de trabalho em um arquivo SQLite, compartilhável entre processos de uma mesma máquina
+        ou entre máquinas que acessem o mesmo sistema de arquivos com lock confiável.
+        Cada concessão é feita em uma transação BEGIN IMMEDIATE, que bloqueia os demais escritores,
+        de modo que um item nunca é entregue a dois workers ao mesmo tempo.
+    """
+    def __init__(self, path='work_queue.sqlite', timeout=60):
+        """
+            Args:
+                path (str): caminho do arquivo SQLite da fila
+                timeout (float): tempo máximo, em segundos, de espera pelo lock do banco
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        with self.lock:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS items (
+                                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                     kind TEXT NOT NULL,
+                                     key TEXT NOT NULL,
+                                     payload TEXT,
+                                     status TEXT NOT NULL,
+                                     worker TEXT,
+                                     lease_until REAL,
+                                     attempts INTEGER NOT NULL DEFAULT 0,
+                                     error TEXT,
+                                     updated_at REAL,
+                                     UNIQUE (kind, key))''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS items_status ON items (kind, status, id)')
+
+    def __transaction(self, fn):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(self.conn)
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+            return result
+
+    @staticmethod
+    def __insert(conn, kind, key, payload, requeue, now):
+        if not requeue:
+            return conn.execute('INSERT OR IGNORE INTO items (kind, key, payload, status, updated_at) VALUES (?, ?, ?, ?, ?)',
+                                (kind, key, json.dumps(payload), PENDING, now)).rowcount
+        return conn.execute('''INSERT INTO items (kind, key, payload, status, updated_at) VALUES (?, ?, ?, ?, ?)
+                               ON CONFLICT (kind, key) DO UPDATE SET payload = excluded.payload, status = excluded.status,
+                                   worker = NULL, lease_until = NULL, attempts = 0, error = NULL, updated_at = excluded.updated_at
+                               WHERE status IN (?, ?)''',
+                            (kind, key, json.dumps(payload), PENDING, now, DONE, FAILED)).rowcount
+
+    def put(self, kind, key, payload, requeue=False):
+        return self.__transaction(lambda conn: self.__insert(conn, kind, key, payload, requeue, time.time()) > 0)
+
+    def put_many(self, kind, items, requeue=False):
+        """ Enfileira vários itens em uma única transação """
+        def insert(conn):
+            now = time.time()
+            return sum(self.__insert(conn, kind, key, payload, requeue, now) for key, payload in items)
+        return self.__transaction(insert)
+
+    def lease(self, kind, worker, duration, retries=3):
+        def take(conn):
+            now = time.time()
+            conn.execute('UPDATE items SET status = ?, error = ?, updated_at = ? WHERE kind = ? AND status = ? AND lease_until < ? AND attempts > ?',
+                         (FAILED, 'concessão expirada', now, kind, LEASED, now, retries))
+            row = conn.execute('SELECT id, key, payload, attempts FROM items WHERE kind = ? AND (status = ? OR (status = ? AND lease_until < ?)) ORDER BY id LIMIT 1',
+                               (kind, PENDING, LEASED, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE items SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                         (LEASED, worker, now + duration, now, row[0]))
+            return {'id': row[0], 'kind': kind, 'key': row[1], 'payload': json.loads(row[2]), 'attempts': row[3] + 1}
+        return self.__transaction(take)
+
+    def complete(self, item_id, worker):
+        def done(conn):
+            return conn.execute('UPDATE items SET status = ?, lease_until = NULL, error = NULL, updated_at = ? WHERE id = ? AND worker = ? AND status = ?',
+                                (DONE, time.time(), item_id, worker, LEASED)).rowcount > 0
+        return self.__transaction(done)
+
+    def fail(self, item_id, worker, error, retries=3):
+        def failed(conn):
+            row = conn.execute('SELECT attempts FROM items WHERE id = ? AND worker = ? AND status = ?', (item_id, worker, LEASED)).fetchone()
+            if row is None:
+                return False
+            status = FAILED if row[0] > retries else PENDING
+            conn.execute('UPDATE items SET status = ?, lease_until = NULL, error = ?, updated_at = ? WHERE id = ?',
+                         (status, str(error), time.time(), item_id))
+            return status == PENDING
+        return self.__transaction(failed)
+
+    def counts(self, kind):
+        with self.lock:
+            rows = self.conn.execute('SELECT status, COUNT(*) FROM items WHERE kind = ? GROUP BY status', (kind,)).fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def failures(self, kind):
+        with self.lock:
+            rows = self.conn.execute('SELECT key, error FROM items WHERE kind = ? AND status = ?', (kind, FAILED)).fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class Queue_worker:
+    """
+        Consome os itens de um tipo de uma Work_queue em um pool de threads, até que não haja itens
+        pendentes nem concedidos a outros workers. Oferece aos handlers a mesma interface do Work_scheduler
+        (put e pause), de modo que um handler possa enfileirar novos itens para qualquer worker.
+        Com hold, um item processado pode ser concluído apenas quando seu resultado for persistido (ack),
+        por exemplo quando as linhas acumuladas por um writer forem gravadas em disco.
+    """
+    def __init__(self, work_queue, kind, handler, worker=None, workers=1, lease_time=600, retries=3,
+                 encode=None, poll_interval=5, log=None, metrics=None, requeue=False, hold=None, flush=None):
+        """
+            Args:
+                work_queue (Work_queue): fila compartilhada
+                kind (str): tipo dos itens consumidos
+                handler (function): função handler(payload, worker) que processa um item
+                worker (str): identificador deste worker; default '<máquina>-<pid>'
+                workers (int): quantidade de threads
+                lease_time (float): prazo, em segundos, para concluir cada item; deve superar o item mais demorado
+                retries (int): quantidade de novas tentativas de um item que falhou
+                encode (function): converte um item recebido em put no par (key, payload); default usa o próprio item
+                poll_interval (float): intervalo, em segundos, entre consultas quando os itens restantes estão concedidos a outros workers
+                log (object): instância do log a registrar mensagens de error, debug e warning
+                metrics (Metrics): conta as novas tentativas; None para desativar
+                requeue (boolean): True para que os itens enfileirados pelos handlers devolvam à fila itens já
+                    concluídos ou falhos (ver Work_queue.put)
+                hold (function): hold(payload) => identificador do resultado do item processado ainda não persistido,
+                    ou None caso o item possa ser concluído. O item permanece concedido até que ack receba o identificador.
+                flush (function): persiste os resultados pendentes, chamando ack para cada um; chamada quando não há
+                    itens disponíveis, quando a concessão do item retido mais antigo chega à metade do prazo e ao final
+        """
+        self.work_queue = work_queue
+        self.kind = kind
+        self.handler = handler
+        self.worker = worker or '{}-{}'.format(socket.gethostname(), os.getpid())
+        self.workers = workers
+        self.lease_time = lease_time
+        self.retries = retries
+        self.encode = encode or (lambda item: (json.dumps(item), item))
+        self.poll_interval = poll_interval
+        self.log = log
+        self.metrics = metrics
+        self.requeue = requeue
+        self.hold = hold
+        self.flush = flush
+        self.lock = threading.Lock()
+        self.paused_until = 0
+        self.held = {}
+
+    def put(self, item):
+        """ Enfileira um novo item na fila compartilhada """
+        key, payload = self.encode(item)
+        self.work_queue.put(self.kind, key, payload, self.requeue)
+
+    def ack(self, result):
+        """
+            Conclui na fila o item retido cujo resultado foi persistido; identificadores desconhecidos são ignorados.
+            Args:
+                result: identificador retornado por hold
+        """
+        with self.lock:
+            held = self.held.pop(result, None)
+        if held:
+            self.__complete(held[0], held[1])
+
+    def __complete(self, item, worker):
+        if not self.work_queue.complete(item['id'], worker) and self.log:
+            self.log.warning('Concessão do item {} expirou antes da conclusão'.format(item['key']))
+
+    def __release(self, item, worker):
+        """ Conclui o item processado ou, com hold, retém o item até que seu resultado seja persistido """
+        if self.hold:
+            # hold e o registro do item ocorrem sob o lock, para que um ack simultâneo não seja perdido
+            with self.lock:
+                result = self.hold(item['payload'])
+                if result is not None:
+                    self.held[result] = (item, worker, time.monotonic())
+                    return
+        self.__complete(item, worker)
+
+    def __flush_held(self, force):
+        """ Chama flush caso haja itens retidos e force seja True ou o mais antigo esteja na metade do prazo """
+        with self.lock:
+            oldest = min((since for _, _, since in self.held.values()), default=None)
+        if oldest is not None and (force or time.monotonic() - oldest > self.lease_time / 2.0):
+            self.flush()
+
+    def pause(self, seconds):
+        """ Pausa as threads deste worker por 'seconds' segundos """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        if self.log:
+            self.log.warning('Pausando o processamento por {} segundos'.format(seconds))
+
+    def __wait_pause(self):
+        while True:
+            with self.lock:
+                wait = self.paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def __work(self, worker):
+        while True:
+            self.__wait_pause()
+            if self.flush:
+                self.__flush_held(False)
+            item = self.work_queue.lease(self.kind, worker, self.lease_time, self.retries)
+            if item is None:
+                held = len(self.held)
+                if self.flush and held:
+                    # os itens retidos por este worker contam como concedidos até serem persistidos
+                    self.__flush_held(True)
+                    if len(self.held) < held:
+                        continue
+                counts = self.work_queue.counts(self.kind)
+                if not counts[PENDING] and not counts[LEASED]:
+                    return
+                # itens concedidos a outros workers podem gerar novos itens ou ter a concessão expirada
+                time.sleep(self.poll_interval)
+                continue
+            try:
+                self.handler(item['payload'], self)
+            except Exception as e:
+                requeued = self.work_queue.fail(item['id'], worker, e, self.retries)
+                if self.metrics:
+                    self.metrics.increment('retries_total', labels={'final': str(not requeued).lower()}, item=item['key'], error=str(e))
+                if self.log:
+                    if requeued:
+                        self.log.warning('Item {} falhou ({}), nova tentativa {} de {}'.format(item['key'], e, item['attempts'], self.retries))
+                    else:
+                        self.log.error('Item {} falhou após {} tentativas: {}'.format(item['key'], item['attempts'], e))
+                continue
+            self.__release(item, worker)
+
+    def run(self):
+        """
+            Returns:
+                Dicionário {key: erro} com os itens do tipo que falharam após todas as tentativas
+        """
+        threads = [threading.Thread(target=self.__work, args=('{}-{}'.format(self.worker, i),), daemon=True)
+                   for i in range(max(1, self.workers))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if self.flush:
+            self.__flush_held(True)
+        return self.work_queue.failures(self.kind)